@@ -0,0 +1,147 @@
+"""
+Benchmark cho các service của thư viện, trên một file sqlite tạm
+- borrow: nhiều người mượn cùng một đầu sách song song;
+          đọc-rồi-ghi (cách cũ) vs claim bằng một câu UPDATE ... RETURNING
+- cart:   mượn rồi trả một giỏ N cuốn; mỗi cuốn một commit vs cả giỏ một transaction
+
+    python benchmark.py borrow --borrowers 200 --copies 100
+    python benchmark.py cart --items 15 --rounds 20
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import func
+
+from main.extensions import db
+from main.models import Book, Borrow, Copy, User
+from features.borrow_feature import BorrowService
+
+
+def make_app():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+    db.init_app(app)
+    return app, path
+
+
+def read_then_write(user_id, book_id):
+    """borrow_copy trước khi đổi: SELECT rồi UPDATE riêng"""
+    copy = Copy.query.filter_by(book_id=book_id, status="Available").first()
+    if not copy:
+        return None, "No available copies"
+    borrow = Borrow(user_id=user_id, copy_id=copy.id)
+    copy.status = "Borrowed"
+    db.session.add(borrow)
+    db.session.commit()
+    return borrow, None
+
+
+def run_borrowers(app, borrow, borrowers, user_id, book_id):
+    barrier = threading.Barrier(borrowers)
+    outcomes = {"ok": 0, "none_left": 0, "busy": 0, "error": 0}
+    lock = threading.Lock()
+
+    def borrower():
+        with app.app_context():
+            barrier.wait()
+            try:
+                result, error = borrow(user_id, book_id)
+                key = "ok" if result else ("none_left" if error == "No available copies" else "busy")
+            except Exception:
+                db.session.rollback()
+                key = "error"
+            finally:
+                db.session.remove()
+            with lock:
+                outcomes[key] += 1
+
+    threads = [threading.Thread(target=borrower) for _ in range(borrowers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes, time.perf_counter() - started
+
+
+def bench_borrow(borrowers, copies):
+    print(f"{'mode':>16} {'ok':>5} {'none left':>10} {'busy':>5} {'errors':>7} {'double':>7} {'borrows/s':>10}")
+    for mode, borrow in (("read-then-write", read_then_write), ("atomic claim", BorrowService.borrow_copy)):
+        app, path = make_app()
+        with app.app_context():
+            db.create_all()
+            user, book = User(username="bench", email="bench@example.com"), Book(title="Dune", author="Frank Herbert")
+            db.session.add_all([user, book])
+            db.session.commit()
+            db.session.add_all([Copy(book_id=book.id) for _ in range(copies)])
+            db.session.commit()
+            user_id, book_id = user.id, book.id
+
+        outcomes, elapsed = run_borrowers(app, borrow, borrowers, user_id, book_id)
+
+        with app.app_context():
+            # Bản sao có nhiều hơn một lượt mượn chưa trả
+            double = db.session.query(Borrow.copy_id).filter(Borrow.return_date.is_(None)) \
+                .group_by(Borrow.copy_id).having(func.count() > 1).count()
+            db.engine.dispose()
+        os.unlink(path)
+        print(f"{mode:>16} {outcomes['ok']:>5} {outcomes['none_left']:>10} {outcomes['busy']:>5} "
+              f"{outcomes['error']:>7} {double:>7} {outcomes['ok'] / elapsed:>10.0f}")
+
+
+def bench_cart(items, rounds):
+    app, path = make_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", email="bench@example.com")
+        books = [Book(title=f"Book {i}", author="Author") for i in range(items)]
+        db.session.add_all([user, *books])
+        db.session.commit()
+        db.session.add_all([Copy(book_id=book.id) for book in books])
+        db.session.commit()
+        user_id, book_ids = user.id, [book.id for book in books]
+
+        def single():
+            borrow_ids = [BorrowService.borrow_copy(user_id, book_id)[0].id for book_id in book_ids]
+            for borrow_id in borrow_ids:
+                BorrowService.return_copy(borrow_id)
+
+        def batch():
+            results, _ = BorrowService.borrow_copies(user_id, book_ids)
+            BorrowService.return_copies([result["borrow_id"] for result in results])
+
+        print(f"{'mode':>8} {'items/s':>9} {'ms per cart':>12}")
+        for mode, run in (("single", single), ("batch", batch)):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                run()
+            elapsed = time.perf_counter() - started
+            # mỗi cuốn được mượn rồi trả: 2 thao tác
+            print(f"{mode:>8} {2 * items * rounds / elapsed:>9.0f} {elapsed / rounds * 1000:>12.1f}")
+        db.engine.dispose()
+    os.unlink(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    borrow = commands.add_parser("borrow", help="parallel checkouts of one title")
+    borrow.add_argument("--borrowers", type=int, default=200)
+    borrow.add_argument("--copies", type=int, default=100)
+
+    cart = commands.add_parser("cart", help="checkout + return of N books, per item vs one transaction")
+    cart.add_argument("--items", type=int, default=15)
+    cart.add_argument("--rounds", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "borrow":
+        bench_borrow(args.borrowers, args.copies)
+    elif args.command == "cart":
+        bench_cart(args.items, args.rounds)
@@ -1,5 +1,7 @@
+from sqlalchemy.exc import SQLAlchemyError
+
 from main.models import Book
-from .extensions import db
+from main.extensions import db
 
 class BookFeature:
     @staticmethod
@@ -9,6 +11,101 @@ class BookFeature:
         db.session.commit()
         return book
 
+    @staticmethod
+    def add_books(rows: list[dict], on_conflict: str = "skip", batch_size: int = 500) -> dict:
+        """Thêm nhiều sách, mỗi batch một transaction; trùng isbn thì skip hoặc update"""
+        result = {"inserted": 0, "updated": 0, "skipped": 0, "errors": []}
+        for start in range(0, len(rows), batch_size):
+            batch = []
+            for index, row in enumerate(rows[start:start + batch_size], start):
+                book, error = BookFeature.validate_book_row(row)
+                if error:
+                    result["errors"].append({"index": index, "error": error})
+                else:
+                    batch.append((index, book))
+
+            counts, errors = BookFeature.upsert_book_batch(batch, on_conflict)
+            for key, value in counts.items():
+                result[key] += value
+            result["errors"].extend(errors)
+        return result
+
+    @staticmethod
+    def validate_book_row(row) -> tuple:
+        """(book mapping, None) nếu hợp lệ, (None, lỗi) nếu không"""
+        if not isinstance(row, dict):
+            return None, "Expected a JSON object"
+        book = {}
+        for name, column in (("title", Book.title), ("author", Book.author), ("isbn", Book.isbn)):
+            value = row.get(name)
+            if value is None and name == "isbn":
+                continue
+            if not isinstance(value, str) or not value.strip():
+                return None, f"'{name}' must be a non-empty string"
+            if len(value) > column.type.length:
+                return None, f"'{name}' is longer than {column.type.length} characters"
+            book[name] = value
+        return book, None
+
+    @staticmethod
+    def upsert_book_batch(rows: list, on_conflict: str) -> tuple:
+        """Ghi cả batch; nếu DB từ chối (vd. trùng title) thì ghi lại từng dòng để chỉ ra dòng lỗi"""
+        try:
+            return BookFeature._write_book_batch(rows, on_conflict), []
+        except SQLAlchemyError:
+            pass
+
+        counts, errors = {"inserted": 0, "updated": 0, "skipped": 0}, []
+        for index, book in rows:
+            try:
+                row_counts = BookFeature._write_book_batch([(index, book)], on_conflict)
+            except SQLAlchemyError as error:
+                errors.append({"index": index, "error": str(getattr(error, "orig", None) or error)})
+                continue
+            for key, value in row_counts.items():
+                counts[key] += value
+        return counts, errors
+
+    @staticmethod
+    def _write_book_batch(rows: list, on_conflict: str) -> dict:
+        """Một transaction; counts chỉ có nghĩa khi commit thành công, lỗi thì rollback rồi raise"""
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        isbns = [book["isbn"] for _, book in rows if book.get("isbn")]
+        existing = dict(
+            db.session.query(Book.isbn, Book.id).filter(Book.isbn.in_(isbns)).all()
+        ) if isbns else {}
+
+        inserts, updates, pending = [], [], {}
+        for _, book in rows:
+            isbn = book.get("isbn")
+            if isbn in existing:
+                if on_conflict == "update":
+                    updates.append(dict(book, id=existing[isbn]))
+                    counts["updated"] += 1
+                else:
+                    counts["skipped"] += 1
+            elif isbn in pending:
+                # trùng isbn trong cùng batch: update thì dòng sau thắng
+                if on_conflict == "update":
+                    pending[isbn].update(book)
+                    counts["updated"] += 1
+                else:
+                    counts["skipped"] += 1
+            else:
+                inserts.append(dict(book))
+                counts["inserted"] += 1
+                if isbn:
+                    pending[isbn] = inserts[-1]
+
+        try:
+            db.session.bulk_insert_mappings(Book, inserts)
+            db.session.bulk_update_mappings(Book, updates)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+        return counts
+
     @staticmethod
     def get_all_books(book_id: int) -> list[Book]:
         return Book.query.all()
@@ -1,22 +1,186 @@
 from main.models import Borrow, Copy
-from .extensions import db
+from main.extensions import db
+from features.copy_feature import adjust_copy_counters, set_copy_status
 from datetime import datetime
+import random
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.exc import OperationalError
+
+# Trang mặc định / tối đa của list_borrows_page
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Lần thử lại khi DB báo bận (SQLITE_BUSY / lock timeout) trước khi trả lỗi
+MAX_CLAIM_ATTEMPTS = 5
+
+
+def claim_copy_statement(book_id):
+    """UPDATE copy SET status='Borrowed' WHERE id = (bản Available đầu tiên) AND status='Available' RETURNING id
+
+    Đọc và ghi nằm trong một câu lệnh nên hai request không thể lấy cùng một bản.
+    Postgres/MySQL thêm FOR UPDATE SKIP LOCKED: request sau bỏ qua dòng đang bị
+    giữ thay vì chờ; SQLite chỉ có một writer nên không cần.
+    """
+    candidate = (
+        select(Copy.id)
+        .where(Copy.book_id == book_id, Copy.status == "Available")
+        .order_by(Copy.id)
+        .limit(1)
+    )
+    if db.engine.dialect.name in ("postgresql", "mysql", "mariadb"):
+        candidate = candidate.with_for_update(skip_locked=True)
+    return (
+        update(Copy)
+        .where(Copy.id == candidate.scalar_subquery(), Copy.status == "Available")
+        .values(status="Borrowed")
+        .returning(Copy.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def is_busy_error(error):
+    """SQLITE_BUSY/locked, lock timeout hoặc deadlock: thử lại được; lỗi khác thì không"""
+    message = str(error.orig).lower()
+    return any(word in message for word in ("locked", "busy", "deadlock", "could not obtain lock"))
+
+
+BUSY = "Database busy, try again"
+
+
+def retry_when_busy(operation):
+    """Chạy operation (một transaction), thử lại nếu DB bận; hết lượt thì trả về BUSY"""
+    for attempt in range(MAX_CLAIM_ATTEMPTS):
+        try:
+            return operation()
+        except OperationalError as error:
+            if not is_busy_error(error):
+                raise
+            # DB đang bận: rollback rồi thử lại sau một khoảng ngẫu nhiên tăng dần
+            db.session.rollback()
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    return BUSY
+
 
 class BorrowService:
     @staticmethod
     def borrow_copy(user_id, book_id):
-        # Find an available copy for the book
-        copy = Copy.query.filter_by(book_id=book_id, status="Available").first()
-        if not copy:
-            return None, "No available copies"
+        def claim():
+            # Claim an available copy and record the borrow in one transaction
+            copy_id = db.session.execute(claim_copy_statement(book_id)).scalar()
+            if copy_id is None:
+                db.session.rollback()
+                return None, "No available copies"
+            borrow = Borrow(user_id=user_id, copy_id=copy_id)
+            db.session.add(borrow)
+            adjust_copy_counters(book_id, available=-1)
+            db.session.commit()
+            return borrow, None
 
-        # Create borrow record
-        borrow = Borrow(user_id=user_id, copy_id=copy.id)
-        copy.status = "Borrowed"
+        result = retry_when_busy(claim)
+        return (None, BUSY) if result is BUSY else result
 
-        db.session.add(borrow)
-        db.session.commit()
-        return borrow, None
+    @staticmethod
+    def borrow_copies(user_id, book_ids, partial=False):
+        """Mượn một bản của mỗi book_id trong một transaction, một lần commit cho cả giỏ.
+
+        partial=False: thiếu một cuốn thì không mượn cuốn nào; partial=True: ghi những cuốn mượn được.
+        Trả về (results, committed), results theo thứ tự book_ids.
+        """
+        def checkout():
+            results, borrows, claimed = [], [], {}
+            for book_id in book_ids:
+                copy_id = db.session.execute(claim_copy_statement(book_id)).scalar()
+                if copy_id is None:
+                    results.append({"book_id": book_id, "error": "No available copies"})
+                    borrows.append(None)
+                    continue
+                borrow = Borrow(user_id=user_id, copy_id=copy_id)
+                db.session.add(borrow)
+                results.append({"book_id": book_id, "copy_id": copy_id})
+                borrows.append(borrow)
+                claimed[book_id] = claimed.get(book_id, 0) + 1
+
+            failed = any("error" in result for result in results)
+            if not claimed or (failed and not partial):
+                db.session.rollback()
+                return [result if "error" in result else {"book_id": result["book_id"], "error": "Rolled back"}
+                        for result in results], False
+            for book_id, count in claimed.items():
+                adjust_copy_counters(book_id, available=-count)
+            db.session.commit()
+            for result, borrow in zip(results, borrows):
+                if borrow is not None:
+                    result["borrow_id"] = borrow.id
+            return results, True
+
+        result = retry_when_busy(checkout)
+        if result is BUSY:
+            return [{"book_id": book_id, "error": BUSY} for book_id in book_ids], False
+        return result
+
+    @staticmethod
+    def return_copies(borrow_ids, partial=False):
+        """Trả nhiều lượt mượn trong một transaction: một UPDATE cho borrow, một cho copy, thay vì mỗi dòng một commit"""
+        def check_in():
+            borrows = {
+                borrow.id: borrow
+                for borrow in Borrow.query.options(joinedload(Borrow.copy)).filter(Borrow.id.in_(borrow_ids))
+            }
+            results, returning = [], {}
+            for borrow_id in borrow_ids:
+                borrow = borrows.get(borrow_id)
+                if borrow is None:
+                    results.append({"borrow_id": borrow_id, "error": "Borrow record not found"})
+                elif borrow.return_date or borrow_id in returning:
+                    results.append({"borrow_id": borrow_id, "error": "Copy already returned"})
+                else:
+                    returning[borrow_id] = borrow
+                    results.append({"borrow_id": borrow_id, "copy_id": borrow.copy_id})
+
+            returned = set()
+            if returning:
+                # chỉ dòng còn đang mượn: request khác vừa trả thì không cộng lại lần nữa
+                returned = set(db.session.execute(
+                    update(Borrow)
+                    .where(Borrow.id.in_(returning), Borrow.return_date.is_(None))
+                    .values(return_date=datetime.utcnow())
+                    .returning(Borrow.id)
+                    .execution_options(synchronize_session=False)
+                ).scalars())
+            results = [
+                result if "error" in result or result["borrow_id"] in returned
+                else {"borrow_id": result["borrow_id"], "error": "Copy already returned"}
+                for result in results
+            ]
+            failed = any("error" in result for result in results)
+            if not returned or (failed and not partial):
+                db.session.rollback()
+                return [result if "error" in result else {"borrow_id": result["borrow_id"], "error": "Rolled back"}
+                        for result in results], False
+
+            copies = [returning[borrow_id].copy for borrow_id in returned]
+            db.session.execute(
+                update(Copy)
+                .where(Copy.id.in_([copy.id for copy in copies]))
+                .values(status="Available")
+                .execution_options(synchronize_session=False)
+            )
+            freed = {}
+            for copy in copies:
+                if copy.status != "Available":
+                    freed[copy.book_id] = freed.get(copy.book_id, 0) + 1
+            for book_id, count in freed.items():
+                adjust_copy_counters(book_id, available=count)
+            db.session.commit()
+            return results, True
+
+        result = retry_when_busy(check_in)
+        if result is BUSY:
+            return [{"borrow_id": borrow_id, "error": BUSY} for borrow_id in borrow_ids], False
+        return result
 
     @staticmethod
     def return_copy(borrow_id):
@@ -27,7 +191,7 @@ class BorrowService:
             return None, "Copy already returned"
 
         borrow.return_date = datetime.utcnow()
-        borrow.copy.status = "Available"
+        set_copy_status(borrow.copy, "Available")
 
         db.session.commit()
         return borrow, None
@@ -42,11 +206,40 @@ class BorrowService:
         return False
 
     @staticmethod
-    def list_borrows(user_id=None):
-        query = Borrow.query
+    def borrows_query(user_id=None, active_only=False, borrowed_from=None, borrowed_to=None):
+        """Borrow kèm user, copy và copy.book: 2 query cho cả trang thay vì 1 + 3 query mỗi dòng"""
+        query = Borrow.query.options(
+            joinedload(Borrow.copy).joinedload(Copy.book),
+            # nhiều lượt mượn chung một user: selectin lấy mỗi user một lần
+            selectinload(Borrow.user),
+        )
         if user_id:
             query = query.filter(Borrow.user_id == user_id)
-        return query.all()
+        if active_only:
+            query = query.filter(Borrow.return_date.is_(None))
+        if borrowed_from:
+            query = query.filter(Borrow.borrow_date >= borrowed_from)
+        if borrowed_to:
+            query = query.filter(Borrow.borrow_date < borrowed_to)
+        return query
+
+    @staticmethod
+    def list_borrows(user_id=None):
+        return BorrowService.borrows_query(user_id).all()
+
+    @staticmethod
+    def list_borrows_page(user_id=None, active_only=False, borrowed_from=None, borrowed_to=None,
+                          cursor=0, limit=DEFAULT_PAGE_SIZE):
+        """Phân trang theo con trỏ (id > cursor); trả về (borrows, next_cursor), next_cursor None ở trang cuối"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = BorrowService.borrows_query(user_id, active_only, borrowed_from, borrowed_to)
+        if cursor:
+            query = query.filter(Borrow.id > cursor)
+        # lấy dư một dòng để biết còn trang sau hay không
+        borrows = query.order_by(Borrow.id).limit(limit + 1).all()
+        if len(borrows) > limit:
+            return borrows[:limit], borrows[limit - 1].id
+        return borrows, None
 
     @staticmethod
     def admin_update_borrow(borrow_id, user_id=None, copy_id=None, return_date=None):
@@ -66,18 +259,18 @@ class BorrowService:
                 return None
             # Update copy status if changed
             if old_copy.id != new_copy.id:
-                if old_copy.status == "Borrowed":
-                    old_copy.status = "Available"
                 if new_copy.status != "Available":
                     return None  # cannot assign borrowed copy
-                new_copy.status = "Borrowed"
-                borrow.copy_id = copy_id
+                if old_copy.status == "Borrowed":
+                    set_copy_status(old_copy, "Available")
+                set_copy_status(new_copy, "Borrowed")
+                borrow.copy = new_copy
 
         # Update return date
         if return_date is not None:
             borrow.return_date = return_date
             if borrow.copy:
-                borrow.copy.status = "Available" if return_date else "Borrowed"
+                set_copy_status(borrow.copy, "Available" if return_date else "Borrowed")
 
         db.session.commit()
         return borrow
@@ -90,7 +283,7 @@ class BorrowService:
 
         # If the borrow was still active, mark copy as available
         if borrow.return_date is None and borrow.copy:
-            borrow.copy.status = "Available"
+            set_copy_status(borrow.copy, "Available")
 
         db.session.delete(borrow)
         db.session.commit()
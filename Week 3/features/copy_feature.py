@@ -1,5 +1,28 @@
-from main.models import Copy, Book
-from .extensions import db
+from main.models import Copy, Book, RECONCILE_COPY_COUNTERS_SQL
+from main.extensions import db
+from sqlalchemy import text, update
+
+
+def adjust_copy_counters(book_id, available=0, total=0):
+    """Cộng dồn bằng SQL (col = col + n), không đọc-sửa-ghi, nên request song song không ghi đè nhau"""
+    if available or total:
+        db.session.execute(
+            update(Book)
+            .where(Book.id == book_id)
+            .values(
+                copies_available=Book.copies_available + available,
+                total_copies=Book.total_copies + total,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+def set_copy_status(copy, status):
+    """Đổi status của copy, copies_available của sách đổi theo nếu copy vào/ra trạng thái Available"""
+    delta = (status == "Available") - (copy.status == "Available")
+    copy.status = status
+    adjust_copy_counters(copy.book_id, available=delta)
+
 
 class CopyService:
     @staticmethod
@@ -9,6 +32,7 @@ class CopyService:
             return None
         copy = Copy(book_id=book_id, status=status)
         db.session.add(copy)
+        adjust_copy_counters(book_id, available=int(status == "Available"), total=1)
         db.session.commit()
         return copy
 
@@ -22,7 +46,7 @@ class CopyService:
         if not copy:
             return None
         if status:
-            copy.status = status
+            set_copy_status(copy, status)
         db.session.commit()
         return copy
 
@@ -31,6 +55,14 @@ class CopyService:
         copy = Copy.query.get(copy_id)
         if not copy:
             return False
+        adjust_copy_counters(copy.book_id, available=-int(copy.status == "Available"), total=-1)
         db.session.delete(copy)
         db.session.commit()
-        return True
\ No newline at end of file
+        return True
+
+    @staticmethod
+    def reconcile_counters():
+        """Tính lại copies_available/total_copies của mọi sách; trả về số sách đã bị lệch"""
+        fixed = db.session.execute(text(RECONCILE_COPY_COUNTERS_SQL)).rowcount
+        db.session.commit()
+        return fixed
@@ -1,40 +1,137 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, has_app_context
+
 from main.models import User
-from werkzeug.security import check_password_hash, generate_password_hash
-from .extensions import db
+from main.extensions import db, passwords
+
+# Bản chụp các cột cần cho xác thực/phân quyền; không giữ ORM instance qua request/thread
+Principal = namedtuple("Principal", "id email role password")
+
+# Cache theo process: số user tối đa và thời gian sống (worker khác đổi role thì chậm tối đa bấy nhiêu giây)
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+
+
+class PrincipalCache:
+    """Principal theo email hoặc id: trong request (flask.g), rồi LRU+TTL chung của process, cuối cùng mới query DB"""
+
+    def __init__(self, max_size=PRINCIPAL_CACHE_SIZE, ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()  # ("email", email) / ("id", id) -> (expires_at, Principal)
+        self._lock = threading.Lock()
+        self.stats = {"request_hits": 0, "process_hits": 0, "queries": 0}
+
+    @staticmethod
+    def _request_cache():
+        if not has_app_context():
+            return None
+        if "principals" not in g:
+            g.principals = {}
+        return g.principals
+
+    def by_email(self, email):
+        return self._get(("email", email), lambda: User.query.filter_by(email=email).first())
+
+    def by_id(self, user_id):
+        return self._get(("id", user_id), lambda: db.session.get(User, user_id))
+
+    def _get(self, key, load):
+        local = self._request_cache()
+        if local is not None and key in local:
+            self.stats["request_hits"] += 1
+            return local[key]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["process_hits"] += 1
+                principal = entry[1]
+            else:
+                principal = None
+        if principal is None:
+            self.stats["queries"] += 1
+            user = load()
+            # Không cache "không tồn tại", nên user vừa tạo thấy được ngay
+            if user is None:
+                return None
+            principal = Principal(user.id, user.email, user.role, user.password)
+            expires_at = time.monotonic() + self.ttl
+            with self._lock:
+                for cache_key in (("email", principal.email), ("id", principal.id)):
+                    self._entries[cache_key] = (expires_at, principal)
+                    self._entries.move_to_end(cache_key)
+                while len(self._entries) > 2 * self.max_size:
+                    self._entries.popitem(last=False)
+
+        if local is not None:
+            local[("email", principal.email)] = local[("id", principal.id)] = principal
+        return principal
+
+    def invalidate(self, email, user_id=None):
+        keys = [("email", email), ("id", user_id)]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        local = self._request_cache()
+        if local is not None:
+            for key in keys:
+                local.pop(key, None)
+
+    def queries_avoided(self):
+        return self.stats["request_hits"] + self.stats["process_hits"]
+
+
+principal_cache = PrincipalCache()
+
 
 class UserService:
     @staticmethod
     def create_user(email: str, password: str) -> User:
-        hashed = generate_password_hash(password)
+        hashed = passwords.hash(password)
         user = User(email=email, password=hashed)
         db.session.add(user)
         db.session.commit()
+        principal_cache.invalidate(email, user.id)
         return user
     
     @staticmethod
     def update_password(user_email: str, new_password: str) -> User | None:
         user = User.query.filter_by(email=user_email).first()
-        user.password = generate_password_hash(new_password)
+        user.password = passwords.hash(new_password)
         db.session.commit()
+        principal_cache.invalidate(user_email, user.id)
         return user
     
     @staticmethod
     def verify_user(user_email: str, password: str) -> bool:
-        user = User.query.filter_by(email=user_email).first()
-        if not user:
+        principal = principal_cache.by_email(user_email)
+        if not principal:
             return False
-        return check_password_hash(user.password, password) 
+        valid = passwords.verify(principal.password, password)
+        if valid and passwords.needs_rehash(principal.password):
+            # Tham số hash đã đổi: nâng cấp hash ngay khi có mật khẩu gốc
+            user = db.session.get(User, principal.id)
+            user.password = passwords.hash(password)
+            db.session.commit()
+            principal_cache.invalidate(user_email, user.id)
+        return valid
     
     @staticmethod
     def get_role(user_email: str) -> str | None:
-        user = User.query.filter_by(email=user_email).first()
-        if not user:
+        principal = principal_cache.by_email(user_email)
+        if not principal:
             return False
-        return user.role
+        return principal.role
     
     @staticmethod
     def get_id(user_email: str) -> int | None:
-        user = User.query.filter_by(email=user_email).first()
-        if not user:
+        principal = principal_cache.by_email(user_email)
+        if not principal:
             return False
-        return user.id
\ No newline at end of file
+        return principal.id
\ No newline at end of file
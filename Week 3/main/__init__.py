@@ -1,16 +1,32 @@
 from flask import Flask 
 
-from .extensions import api, db
-from .resources import ns
+from .extensions import api, db, passwords
+from .models import upgrade_book_table
 
 def create_app():
+    # import ở đây để import main.models (services, test) không kéo theo cả API
+    from .resources import ns
+    from .borrow_resources import ns as borrows_ns
+
     app = Flask(__name__)
 
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///db.sqlite3"
 
     api.init_app(app)
     db.init_app(app)
+    passwords.init_app(app)
 
     api.add_namespace(ns)
+    api.add_namespace(borrows_ns)
+
+    with app.app_context(), db.engine.begin() as connection:
+        upgrade_book_table(connection)
+
+    @app.cli.command("reconcile-copy-counters")
+    def reconcile_copy_counters():
+        """Đếm lại copies_available/total_copies của mọi sách từ bảng copy"""
+        from features.copy_feature import CopyService
+
+        print(f"{CopyService.reconcile_counters()} book(s) corrected")
 
     return app
\ No newline at end of file
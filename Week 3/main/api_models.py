@@ -21,4 +21,28 @@ course_input_model = api.model("CourseInput", {
 student_input_model = api.model("StudentInput", {
     "name": fields.String,
     "course_id": fields.Integer
-})
\ No newline at end of file
+})
+
+# Mượn/trả nhiều cuốn một lần ("giỏ")
+checkout_input_model = api.model("CheckoutInput", {
+    "user_id": fields.Integer(required=True),
+    "book_ids": fields.List(fields.Integer, required=True),
+    "partial": fields.Boolean(default=False, description="false: all-or-nothing"),
+})
+
+return_input_model = api.model("ReturnInput", {
+    "borrow_ids": fields.List(fields.Integer, required=True),
+    "partial": fields.Boolean(default=False, description="false: all-or-nothing"),
+})
+
+batch_item_model = api.model("BatchItem", {
+    "book_id": fields.Integer,
+    "borrow_id": fields.Integer,
+    "copy_id": fields.Integer,
+    "error": fields.String,
+})
+
+batch_result_model = api.model("BatchResult", {
+    "committed": fields.Boolean,
+    "results": fields.List(fields.Nested(batch_item_model, skip_none=True)),
+})
@@ -0,0 +1,41 @@
+from flask_restx import Resource, Namespace
+
+from .api_models import checkout_input_model, return_input_model, batch_result_model
+from features.borrow_feature import BorrowService
+
+ns = Namespace("borrows")
+
+# Số cuốn tối đa trong một giỏ
+MAX_BATCH_ITEMS = 100
+
+
+def batch_ids(field):
+    ids = ns.payload.get(field)
+    if not isinstance(ids, list) or not ids or not all(type(item) is int for item in ids):
+        ns.abort(400, f"{field} must be a non-empty list of integers")
+    if len(ids) > MAX_BATCH_ITEMS:
+        ns.abort(400, f"At most {MAX_BATCH_ITEMS} items per request")
+    return ids
+
+
+@ns.route("/checkout")
+class BorrowCheckout(Resource):
+    @ns.expect(checkout_input_model)
+    @ns.marshal_with(batch_result_model)
+    def post(self):
+        book_ids = batch_ids("book_ids")
+        results, committed = BorrowService.borrow_copies(
+            ns.payload.get("user_id"), book_ids, partial=bool(ns.payload.get("partial"))
+        )
+        # all-or-nothing thất bại: 409, không có gì được ghi
+        return {"committed": committed, "results": results}, 200 if committed else 409
+
+
+@ns.route("/return")
+class BorrowReturn(Resource):
+    @ns.expect(return_input_model)
+    @ns.marshal_with(batch_result_model)
+    def post(self):
+        borrow_ids = batch_ids("borrow_ids")
+        results, committed = BorrowService.return_copies(borrow_ids, partial=bool(ns.payload.get("partial")))
+        return {"committed": committed, "results": results}, 200 if committed else 409
@@ -1,5 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy 
 from flask_restx import Api
 
+from .passwords import PasswordService
+
 api = Api()
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+passwords = PasswordService()
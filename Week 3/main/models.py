@@ -1,5 +1,6 @@
 from .extensions import db 
 from datetime import datetime
+from sqlalchemy import inspect
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,26 +18,62 @@ class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), unique=True)
     author = db.Column(db.String(50))
+    isbn = db.Column(db.String(20), unique=True, index=True)
+    # Đếm sẵn theo ERD tuần 5, CopyService/BorrowService cập nhật cùng transaction
+    copies_available = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    total_copies = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     #1 sách có thể có nhiều bản sao
     copies = db.relationship("Copy", back_populates="book")
 
 class Borrow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.ForeignKey("student.id"))
-    book_id = db.Column(db.ForeignKey("book.id"))
+    user_id = db.Column(db.ForeignKey("user.id"))
+    # mượn theo bản sao cụ thể, sách lấy qua copy.book
+    copy_id = db.Column(db.ForeignKey("copy.id"))
     borrow_date = db.Column(db.DateTime, default=datetime.utcnow)
     return_date = db.Column(db.DateTime, nullable=True)
 
+    # Lượt mượn đang mở của một user / một bản sao: WHERE ... AND return_date IS NULL
+    __table_args__ = (
+        db.Index("ix_borrow_user_id_return_date", "user_id", "return_date"),
+        db.Index("ix_borrow_copy_id_return_date", "copy_id", "return_date"),
+    )
+
     #Quan hej
-    user = db.relationships("User", back_populates="borrows")
-    copy = db.relationships("Copy", back_populates="borrows")
+    user = db.relationship("User", back_populates="borrows")
+    copy = db.relationship("Copy", back_populates="borrows")
 
 class Copy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    book_id = db.Column(db.Integer, db.ForeignKey("book.id"))
-    status = db.Column(db.String(20), default="available") #available/borrowed
+    book_id = db.Column(db.Integer, db.ForeignKey("book.id"), index=True)
+    status = db.Column(db.String(20), default="Available") #Available/Borrowed
 
     book = db.relationship("Book", back_populates="copies")
     borrows = db.relationship("Borrow", back_populates="copy")
 
+
+# Đếm lại bộ đếm của mọi sách từ bảng copy; chỉ ghi những dòng bị lệch
+RECONCILE_COPY_COUNTERS_SQL = """
+UPDATE book SET
+    total_copies = (SELECT count(*) FROM copy WHERE copy.book_id = book.id),
+    copies_available = (SELECT count(*) FROM copy WHERE copy.book_id = book.id AND copy.status = 'Available')
+WHERE total_copies != (SELECT count(*) FROM copy WHERE copy.book_id = book.id)
+   OR copies_available != (SELECT count(*) FROM copy WHERE copy.book_id = book.id AND copy.status = 'Available')
+"""
+
+
+def upgrade_book_table(connection):
+    # db cũ tạo trước khi có isbn/bộ đếm: create_all không thêm cột vào bảng đã có
+    inspector = inspect(connection)
+    if not inspector.has_table("book"):
+        return
+    columns = {c["name"] for c in inspector.get_columns("book")}
+    if "isbn" not in columns:
+        connection.exec_driver_sql("ALTER TABLE book ADD COLUMN isbn VARCHAR(20)")
+    connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_book_isbn ON book (isbn)")
+    if "total_copies" not in columns:
+        connection.exec_driver_sql("ALTER TABLE book ADD COLUMN copies_available INTEGER NOT NULL DEFAULT 0")
+        connection.exec_driver_sql("ALTER TABLE book ADD COLUMN total_copies INTEGER NOT NULL DEFAULT 0")
+        if inspector.has_table("copy"):
+            connection.exec_driver_sql(RECONCILE_COPY_COUNTERS_SQL)
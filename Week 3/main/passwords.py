@@ -0,0 +1,73 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Hash cost theo môi trường, vd. "pbkdf2:sha256:1000" cho dev/test, mặc định của werkzeug cho production
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_VERIFY_WORKERS = int(os.environ.get("PASSWORD_VERIFY_WORKERS", os.cpu_count() or 1))
+PASSWORD_VERIFY_MAX_PENDING = int(os.environ.get("PASSWORD_VERIFY_MAX_PENDING", 4 * PASSWORD_VERIFY_WORKERS))
+PASSWORD_VERIFY_TIMEOUT_SECONDS = float(os.environ.get("PASSWORD_VERIFY_TIMEOUT_SECONDS", 10))
+
+
+class PasswordServiceBusy(Exception):
+    """Quá nhiều lượt verify/hash mật khẩu đang chờ, hoặc một lượt chờ quá lâu"""
+
+
+def hash_parameters(method: str) -> tuple:
+    """Tham số đầy đủ của method, điền mặc định như werkzeug, vd. scrypt -> scrypt:32768:8:1"""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        defaults = ["32768", "8", "1"]
+    elif name == "pbkdf2":
+        defaults = ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return (name, *args)
+    return (name, *args, *defaults[len(args):])
+
+
+class PasswordService:
+    """Hash/verify mật khẩu với cost theo môi trường và một pool verify có giới hạn.
+
+    hashlib nhả GIL nên pool dùng được nhiều core, còn login storm chỉ giữ
+    tối đa max_pending request thread. Chưa init_app thì chạy ngay trên thread gọi.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD):
+        self.method = method
+        self.executor = None
+        self._slots = None
+        self.timeout = None
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", self.method)
+        workers = app.config.get("PASSWORD_VERIFY_WORKERS", PASSWORD_VERIFY_WORKERS)
+        max_pending = app.config.get("PASSWORD_VERIFY_MAX_PENDING", PASSWORD_VERIFY_MAX_PENDING)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        # Hàng đợi của pool không có giới hạn: quá số slot này thì từ chối luôn thay vì xếp hàng
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.timeout = app.config.get("PASSWORD_VERIFY_TIMEOUT_SECONDS", PASSWORD_VERIFY_TIMEOUT_SECONDS)
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Hash được tạo với method/cost khác cấu hình hiện tại"""
+        return hash_parameters(password_hash.split("$", 1)[0]) != hash_parameters(self.method)
+
+    def _run(self, fn, *args, **kwargs):
+        if self.executor is None:
+            return fn(*args, **kwargs)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordServiceBusy()
+        future = self.executor.submit(fn, *args, **kwargs)
+        # nhả slot khi task xong, không phải khi thôi chờ
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordServiceBusy() from None
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: CPU cho mỗi response 304 của GET /books/<id>
+- hash:     serialize + md5 toàn bộ book trước khi so sánh If-None-Match (cách cũ)
+- revision: ETag dựng từ revision counter, so sánh ngay (CacheableDataStore.book_etag)
+
+    python benchmark.py --requests 20000
+"""
+import argparse
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask, request, make_response
+
+EPOCH = uuid.uuid4().hex[:8]
+BOOK = {
+    'id': 1, 'title': 'HTTP: The Definitive Guide',
+    'author': 'David Gourley', 'isbn': '978-1565925090',
+    'publish_year': 2002, 'category': 'Networking',
+    'revision': 7, 'updated_at': datetime.utcnow()
+}
+
+app = Flask(__name__)
+
+
+def hashed_etag(book):
+    return hashlib.md5(json.dumps(book, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def revision_etag(book):
+    return f"{EPOCH}-{book['id']}-{book['revision']}"
+
+
+def not_modified(etag):
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.headers['ETag'] = f'"{etag}"'
+        response.headers['Cache-Control'] = 'public, max-age=300'
+        return response
+    return None
+
+
+@app.route('/hash/books/<int:id>')
+def get_book_hash(id):
+    return not_modified(hashed_etag(BOOK)) or make_response(BOOK, 200)
+
+
+@app.route('/revision/books/<int:id>')
+def get_book_revision(id):
+    return not_modified(revision_etag(BOOK)) or make_response(BOOK, 200)
+
+
+def run(client, url, etag, requests):
+    headers = {'If-None-Match': f'"{etag}"'}
+    started = time.process_time()
+    for _ in range(requests):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 304
+    return (time.process_time() - started) / requests * 1e6
+
+
+def bench_etag(requests):
+    """Chỉ riêng chi phí tạo ETag, không tính Flask"""
+    rows = []
+    for name, fn in (('hash', hashed_etag), ('revision', revision_etag)):
+        started = time.process_time()
+        for _ in range(requests):
+            fn(BOOK)
+        rows.append((name, (time.process_time() - started) / requests * 1e6))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    hash_us = run(client, '/hash/books/1', hashed_etag(BOOK), args.requests)
+    revision_us = run(client, '/revision/books/1', revision_etag(BOOK), args.requests)
+
+    print(f"{'path':>10} {'etag us':>10} {'304 request us':>15}")
+    for (name, etag_us), request_us in zip(bench_etag(args.requests * 5), (hash_us, revision_us)):
+        print(f'{name:>10} {etag_us:>10.2f} {request_us:>15.1f}')
+    print(f'CPU saved per 304: {hash_us - revision_us:.1f} us ({(hash_us - revision_us) / hash_us:.0%})')
@@ -3,25 +3,95 @@ Version 4: Cacheable
 """
 
 from flask import Flask, request, make_response
-from flask_restx import Api, Resource, fields
+from flask_restx import Namespace, Resource, fields
 import hashlib
 import json
-from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 
 
+# create_app (routes/v4/__init__.py) gắn namespace này vào Api
+ns = Namespace('api/v4', description='Cacheable operations')
+
+
+def check_cache_validation(etag=None, last_modified=None):
+    """(True, 304) nếu bản client đang giữ còn mới: If-None-Match khớp etag, hoặc không có
+    If-None-Match và If-Modified-Since không cũ hơn last_modified"""
+    if etag and etag in request.if_none_match:
+        return True, 304
+    if not request.if_none_match and last_modified and request.if_modified_since:
+        # HTTP date chỉ tới giây
+        if last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None):
+            return True, 304
+    return False, 200
+
+
+def add_cache_headers(response, max_age, etag=None, last_modified=None):
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    if etag:
+        response.headers['ETag'] = f'"{etag}"'
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
 # Models
-book_model = api.model('Book', {
+book_model = ns.model('Book', {
     'id': fields.Integer(readonly=True),
     'title': fields.String(required=True),
     'author': fields.String(required=True),
     'isbn': fields.String(required=True),
     'publish_year': fields.Integer(),
     'category': fields.String(),
+    'revision': fields.Integer(readonly=True, description='Bumped on every update'),
     'updated_at': fields.DateTime(description='Last modified time')
 })
 
-stats_model = api.model('Statistics', {
+# Batch revalidation: client gửi (id, etag) đang cache, server chỉ trả phần đã đổi
+revalidate_entry_model = ns.model('RevalidateEntry', {
+    'id': fields.Integer(required=True),
+    'etag': fields.String(description='ETag from the cached GET /books/<id>'),
+    'updated_at': fields.DateTime(description='Used when the client has no ETag')
+})
+
+revalidate_input_model = ns.model('RevalidateInput', {
+    'books': fields.List(fields.Nested(revalidate_entry_model), required=True)
+})
+
+book_version_model = ns.inherit('BookVersion', book_model, {
+    'etag': fields.String(description='Store this for the next revalidation')
+})
+
+revalidate_result_model = ns.model('RevalidateResult', {
+    'changed': fields.List(fields.Nested(book_version_model)),
+    'deleted': fields.List(fields.Integer),
+    'unchanged': fields.Integer(),
+    'revision': fields.Integer(description='Store revision at the time of the check')
+})
+
+MAX_REVALIDATE_ENTRIES = 5000
+
+# Delta feed: /books/changes?since=<revision>
+change_model = ns.model('BookChange', {
+    'revision': fields.Integer(),
+    'op': fields.String(enum=['insert', 'update', 'delete']),
+    'id': fields.Integer(),
+    'book': fields.Nested(book_model, allow_null=True, description='null for tombstones')
+})
+
+changes_model = ns.model('BookChanges', {
+    'revision': fields.Integer(description='Pass as since on the next call'),
+    'epoch': fields.String(description='Pass back as epoch; changes after a restart'),
+    'changes': fields.List(fields.Nested(change_model))
+})
+
+CHANGE_LOG_SIZE = 10000
+
+stats_model = ns.model('Statistics', {
     'total_books': fields.Integer(),
     'available_books': fields.Integer(),
     'borrowed_books': fields.Integer(),
@@ -29,8 +99,97 @@ stats_model = api.model('Statistics', {
     'generated_at': fields.DateTime()
 })
 
+class ResponseCache:
+    """
+    Server-side cache cho GET responses: LRU eviction + TTL theo từng route.
+    Entry được gắn tag (vd. 'book:1', 'book:2') để invalidate chính xác khi data thay đổi.
+    """
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # key -> (expires_at, tags, version, value)
+        self.tags = {}                 # tag -> set(key)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(route, **params):
+        """Key = (route, args, representation) của request hiện tại"""
+        args = tuple(sorted(request.args.items(multi=True)))
+        representation = request.accept_mimetypes.best or '*/*'
+        return (route, tuple(sorted(params.items())), args, representation)
+
+    def get(self, key, version=None):
+        """
+        version: revision/stats_version hiện tại của data; entry dựng từ version cũ
+        (vd. set sau khi đã bị invalidate) bị coi là miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, tags, entry_version, value = entry
+            if expires_at <= time.monotonic() or entry_version != version:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl, tags=(), version=None):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, tags, version, value)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in self.tags.pop(tag, set()):
+                    if key in self.entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def _remove(self, key):
+        _, tags, _, _ = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+response_cache = ResponseCache()
+
+# Do store tự gán, bỏ qua nếu có trong payload
+READONLY_BOOK_FIELDS = ('id', 'revision', 'updated_at', 'etag')
+
 class CacheableDataStore:
-    def __init__(self):
+    def __init__(self, cache=None):
+        self.cache = cache
         self.books = {
             1: {
                 'id': 1, 'title': 'HTTP: The Definitive Guide', 
@@ -53,6 +212,97 @@ class CacheableDataStore:
         }
         self.book_counter = 4
         self.last_modified = datetime.utcnow()
+
+        # Revision counters: ETag = epoch + id + revision, không cần serialize/hash.
+        # epoch đổi mỗi lần khởi động nên ETag cũ không bao giờ trùng sau restart
+        self.epoch = uuid.uuid4().hex[:8]
+        self.revision = 1
+        for book in self.books.values():
+            book['revision'] = 1
+
+        # Aggregates duy trì incremental (O(1) mỗi lần ghi) thay vì duyệt lại toàn bộ books
+        self.category_counts = {}
+        for book in self.books.values():
+            self._count_category(book.get('category', 'Unknown'), 1)
+        self.stats_version = 1
+        self._stats_snapshot = None
+
+        # Change log: ring buffer (revision, op, book_id), entry cũ nhất tự bị đẩy ra.
+        # changes_floor = revision mà log bao phủ từ đó trở đi
+        self.changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self.changes_floor = 0
+        # Sách có sẵn được ghi như insert ở revision 1, nên since=0 = từ đầu
+        for book_id in self.books:
+            self._log_change('insert', book_id)
+
+    def _count_category(self, category, delta):
+        count = self.category_counts.get(category, 0) + delta
+        if count:
+            self.category_counts[category] = count
+        else:
+            self.category_counts.pop(category, None)
+
+    def _bump_revision(self):
+        self.revision += 1
+        return self.revision
+
+    def _log_change(self, op, book_id):
+        if len(self.changes) == self.changes.maxlen:
+            self.changes_floor = self.changes[0][0]
+        self.changes.append((self.revision, op, book_id))
+
+    def changes_since(self, since):
+        """
+        Thay đổi sau revision `since`, mỗi book chỉ lấy thay đổi mới nhất.
+        Trả về None nếu since đã rơi ra khỏi ring buffer (client phải tải lại /books).
+        """
+        if since < self.changes_floor or since > self.revision:
+            return None
+        latest = {}
+        # Duyệt ngược từ mới nhất, dừng khi tới since
+        for revision, op, book_id in reversed(self.changes):
+            if revision <= since:
+                break
+            latest.setdefault(book_id, (revision, op))
+        changes = []
+        for book_id, (revision, op) in sorted(latest.items(), key=lambda item: (item[1][0], item[0])):
+            book = self.books.get(book_id) if op != 'delete' else None
+            changes.append({'revision': revision, 'op': op, 'id': book_id, 'book': book})
+        return changes
+
+    def book_etag(self, book):
+        return f"{self.epoch}-{book['id']}-{book['revision']}"
+
+    def revalidate(self, entries):
+        """
+        So từng (id, etag) với revision hiện tại: O(1) mỗi book, không hash/serialize.
+        Entry không có etag thì so updated_at. Trả về (changed books, deleted ids, unchanged count).
+        """
+        changed, deleted, unchanged = [], [], 0
+        for entry in entries:
+            book = self.books.get(entry['id'])
+            if book is None:
+                deleted.append(entry['id'])
+                continue
+            etag = (entry.get('etag') or '').removeprefix('W/').strip('"')
+            if etag:
+                fresh = etag == self.book_etag(book)
+            else:
+                updated_at = entry.get('updated_at')
+                fresh = updated_at is not None and book['updated_at'] <= updated_at
+            if fresh:
+                unchanged += 1
+            else:
+                changed.append({**book, 'etag': self.book_etag(book)})
+        return changed, deleted, unchanged
+
+    def _stats_changed(self):
+        self.stats_version += 1
+        self._stats_snapshot = None
+
+    def _invalidate(self, *tags):
+        if self.cache is not None:
+            self.cache.invalidate(*tags)
     
     def get_all_books(self):
         return list(self.books.values())
@@ -62,53 +312,81 @@ class CacheableDataStore:
     
     def create_book(self, data):
         book = {
+            **{k: v for k, v in data.items() if k not in READONLY_BOOK_FIELDS},
             'id': self.book_counter,
-            **data,
+            'revision': 1,
             'updated_at': datetime.utcnow()
         }
+        self._bump_revision()
+        self._log_change('insert', book['id'])
         self.books[self.book_counter] = book
         self.book_counter += 1
         self.last_modified = datetime.utcnow()
+        self._count_category(book.get('category', 'Unknown'), 1)
+        self._stats_changed()
+        self._invalidate(f"book:{book['id']}")
         return book
     
     def update_book(self, book_id, data):
         if book_id in self.books:
+            old_category = self.books[book_id].get('category', 'Unknown')
+            old_revision = self.books[book_id].get('revision', 0)
+            # Field do server quản lý: payload không được ghi đè, nếu không
+            # "revision": 0 sẽ làm ETag cũ lặp lại cho nội dung đã đổi
+            data = {k: v for k, v in data.items() if k not in READONLY_BOOK_FIELDS}
             self.books[book_id].update(data)
+            self.books[book_id]['revision'] = old_revision + 1
             self.books[book_id]['updated_at'] = datetime.utcnow()
+            self._bump_revision()
+            self._log_change('update', book_id)
             self.last_modified = datetime.utcnow()
+            new_category = self.books[book_id].get('category', 'Unknown')
+            if new_category != old_category:
+                self._count_category(old_category, -1)
+                self._count_category(new_category, 1)
+                self._stats_changed()
+            self._invalidate(f'book:{book_id}')
             return self.books[book_id]
         return None
     
     def delete_book(self, book_id):
         if book_id in self.books:
-            del self.books[book_id]
+            book = self.books.pop(book_id)
+            self._bump_revision()
+            self._log_change('delete', book_id)
             self.last_modified = datetime.utcnow()
+            self._count_category(book.get('category', 'Unknown'), -1)
+            self._stats_changed()
+            self._invalidate(f'book:{book_id}')
             return True
         return False
     
     def get_statistics(self):
-        """Generate statistics - expensive operation, good for caching"""
-        books = list(self.books.values())
-        categories = {}
-        for book in books:
-            cat = book.get('category', 'Unknown')
-            categories[cat] = categories.get(cat, 0) + 1
-        
-        return {
-            'total_books': len(books),
-            'available_books': len(books),
-            'borrowed_books': 0,
-            'categories': categories,
-            'generated_at': datetime.utcnow()
-        }
+        """
+        Statistics snapshot từ các counter incremental.
+        Chỉ dựng lại (O(số category)) khi stats_version thay đổi.
+        """
+        if self._stats_snapshot is None:
+            self._stats_snapshot = {
+                'total_books': len(self.books),
+                'available_books': len(self.books),
+                'borrowed_books': 0,
+                'categories': dict(self.category_counts),
+                'generated_at': datetime.utcnow()
+            }
+        return self._stats_snapshot
 
-db = CacheableDataStore()
+    def statistics_etag(self):
+        """stats_version chính là ETag, không cần hash JSON"""
+        return f'stats-{self.epoch}-{self.stats_version}'
+
+db = CacheableDataStore(cache=response_cache)
 
 @ns.route('/books/<int:id>')
 @ns.param('id', 'Book identifier')
 class BookResource(Resource):
     @ns.doc('get_book_cacheable')
-    @ns.marshal_with(book_model)
+    @ns.response(200, 'Book', book_model)
     def get(self, id):
         """
         GET single book with caching
@@ -116,12 +394,12 @@ class BookResource(Resource):
         """
         book = db.get_book(id)
         if not book:
-            api.abort(404, f"Book {id} not found")
-        
-        # Generate ETag
-        etag = generate_etag(book)
-        
-        # Check cache
+            ns.abort(404, f"Book {id} not found")
+        # Một bản chụp duy nhất cho cả ETag lẫn body, để hai thứ luôn cùng revision
+        book = dict(book)
+
+        # ETag từ revision counter: 304 trả về trước khi marshal/hash bất cứ thứ gì
+        etag = db.book_etag(book)
         is_cached, status_code = check_cache_validation(
             etag=etag,
             last_modified=book['updated_at']
@@ -132,9 +410,19 @@ class BookResource(Resource):
             response.headers['ETag'] = f'"{etag}"'
             response.headers['Cache-Control'] = 'public, max-age=300'  # 5 minutes
             return response
+
+        # Server-side cache cho body đã marshal + serialize: hit thì không phải làm lại hai bước đó.
+        # Entry gắn revision: body dựng trước một lần update (set sau invalidate)
+        # không bao giờ được trả về dưới ETag mới
+        cache_key = response_cache.make_key('book', id=id)
+        body = response_cache.get(cache_key, version=book['revision'])
+        if body is None:
+            body = json.dumps(ns.marshal(book, book_model))
+            response_cache.set(cache_key, body, ttl=300, tags=(f'book:{id}',), version=book['revision'])
         
         # Fresh data
-        response = make_response(book, 200)
+        response = make_response(body, 200)
+        response.mimetype = 'application/json'
         response = add_cache_headers(
             response,
             max_age=300,  # Cache individual book for 5 minutes
@@ -150,15 +438,13 @@ class BookResource(Resource):
         """
         PUT: Update book (Invalidates cache)
         """
-        data = api.payload
+        data = ns.payload
         book = db.update_book(id, data)
         if not book:
-            api.abort(404, f"Book {id} not found")
+            ns.abort(404, f"Book {id} not found")
         
         # No cache for modified resource
-        response = make_response(book, 200)
-        response.headers['Cache-Control'] = 'no-cache'
-        return response
+        return book, 200, {'Cache-Control': 'no-cache'}
     
     @ns.doc('delete_book_invalidate')
     def delete(self, id):
@@ -166,23 +452,88 @@ class BookResource(Resource):
         DELETE: Remove book (Invalidates cache)
         """
         if not db.delete_book(id):
-            api.abort(404, f"Book {id} not found")
+            ns.abort(404, f"Book {id} not found")
         
         response = make_response('', 204)
         response.headers['Cache-Control'] = 'no-cache'
         return response
 
+@ns.route('/books/changes')
+class BookChanges(Resource):
+    @ns.doc('get_book_changes', params={
+        'since': 'Revision from the previous call (0 = from the start)',
+        'epoch': 'Epoch from the previous call'
+    })
+    @ns.marshal_with(changes_model)
+    def get(self):
+        """
+        Delta sync: inserts, updates và tombstones kể từ revision `since`
+        410 khi since đã ra khỏi change log: client tải lại /books rồi tiếp tục từ revision mới
+        """
+        since = request.args.get('since', 0, type=int)
+        if since < 0:
+            ns.abort(400, 'since must not be negative')
+
+        # Revision đếm lại từ đầu sau restart: epoch khác thì since không còn ý nghĩa
+        epoch = request.args.get('epoch')
+        changes = db.changes_since(since) if epoch in (None, db.epoch) else None
+        if changes is None:
+            ns.abort(410, 'Change log no longer covers this revision', revision=db.revision, epoch=db.epoch)
+
+        return {'revision': db.revision, 'epoch': db.epoch, 'changes': changes}, 200, {
+            'Cache-Control': 'no-cache',
+            'ETag': f'"changes-{db.epoch}-{since}-{db.revision}"'
+        }
+
+@ns.route('/books/revalidate')
+class BookRevalidate(Resource):
+    @ns.doc('revalidate_books')
+    @ns.expect(revalidate_input_model)
+    @ns.marshal_with(revalidate_result_model)
+    def post(self):
+        """
+        Batch conditional GET: thay cho N request If-None-Match tới /books/<id>
+        Chỉ trả về books đã đổi (kèm ETag mới) và id đã bị xoá
+        """
+        entries = (ns.payload or {}).get('books')
+        if not isinstance(entries, list):
+            ns.abort(400, "'books' must be a list of {id, etag}")
+        if len(entries) > MAX_REVALIDATE_ENTRIES:
+            ns.abort(413, f'At most {MAX_REVALIDATE_ENTRIES} books per request')
+
+        parsed = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not isinstance(entry.get('id'), int):
+                ns.abort(400, "Every entry needs an integer 'id'")
+            updated_at = entry.get('updated_at')
+            if updated_at:
+                try:
+                    updated_at = datetime.fromisoformat(updated_at)
+                except (TypeError, ValueError):
+                    ns.abort(400, f"Invalid updated_at for book {entry['id']}")
+                # updated_at trong store là UTC naive (datetime.utcnow)
+                if updated_at.tzinfo is not None:
+                    updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+            parsed.append({'id': entry['id'], 'etag': entry.get('etag'), 'updated_at': updated_at})
+
+        changed, deleted, unchanged = db.revalidate(parsed)
+        # Kết quả phụ thuộc vào body của request nên không cache
+        return {
+            'changed': changed,
+            'deleted': deleted,
+            'unchanged': unchanged,
+            'revision': db.revision
+        }, 200, {'Cache-Control': 'no-store'}
+
 @ns.route('/statistics')
 class Statistics(Resource):
     @ns.doc('get_statistics_cached')
-    @ns.marshal_with(stats_model)
+    @ns.response(200, 'Statistics', stats_model)
     def get(self):
+        # get_statistics đã giữ snapshot tới khi stats_version đổi, nên không cache thêm lần nữa
         stats = db.get_statistics()
-        
-        # Generate ETag
-        etag = generate_etag(stats)
-        
-        # Check cache
+        etag = db.statistics_etag()
+
         is_cached, status_code = check_cache_validation(
             etag=etag,
             last_modified=db.last_modified
@@ -194,7 +545,7 @@ class Statistics(Resource):
             response.headers['Cache-Control'] = 'public, max-age=600'
             return response
         
-        response = make_response(stats, 200)
+        response = make_response(ns.marshal(stats, stats_model), 200)
         response = add_cache_headers(
             response,
             max_age=600,  # Cache 10 phut
@@ -203,3 +554,11 @@ class Statistics(Resource):
         )
         return response
 
+@ns.route('/cache/stats')
+class CacheStats(Resource):
+    @ns.doc('get_cache_stats')
+    def get(self):
+        """Server-side response cache counters (hit/miss/eviction)"""
+        response = make_response(response_cache.stats(), 200)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
@@ -0,0 +1,217 @@
+import unittest
+from unittest import mock
+
+import routes.v4.cacheable as cacheable
+from routes.v4 import create_app
+from routes.v4.cacheable import CacheableDataStore, ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_entries=2)
+
+    def test_lru_eviction_keeps_recently_used(self):
+        self.cache.set('a', 1, ttl=60)
+        self.cache.set('b', 2, ttl=60)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.set('c', 3, ttl=60)
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_entry_expires_after_ttl(self):
+        with mock.patch.object(cacheable.time, 'monotonic', return_value=100.0):
+            self.cache.set('a', 1, ttl=10)
+        with mock.patch.object(cacheable.time, 'monotonic', return_value=109.0):
+            self.assertEqual(self.cache.get('a'), 1)
+        with mock.patch.object(cacheable.time, 'monotonic', return_value=110.0):
+            self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_invalidate_by_tag(self):
+        self.cache.set('a', 1, ttl=60, tags=('book:1',))
+        self.cache.set('b', 2, ttl=60, tags=('book:2',))
+        self.cache.invalidate('book:1')
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertNotIn('book:1', self.cache.tags)
+
+    def test_stale_version_is_a_miss(self):
+        self.cache.set('a', 'old', ttl=60, version=1)
+        self.assertIsNone(self.cache.get('a', version=2))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_counters(self):
+        self.cache.set('a', 1, ttl=60)
+        self.cache.get('a')
+        self.cache.get('missing')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+
+class DataStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.store = CacheableDataStore(cache=self.cache)
+
+    def full_recount(self):
+        counts = {}
+        for book in self.store.get_all_books():
+            category = book.get('category', 'Unknown')
+            counts[category] = counts.get(category, 0) + 1
+        return counts
+
+    def test_statistics_follow_writes(self):
+        book = self.store.create_book({'title': 'SICP', 'category': 'Programming'})
+        self.store.update_book(1, {'category': 'Programming'})
+        self.store.delete_book(book['id'])
+
+        stats = self.store.get_statistics()
+        self.assertEqual(stats['categories'], self.full_recount())
+        self.assertEqual(stats['total_books'], 3)
+
+    def test_statistics_etag_changes_only_with_stats(self):
+        etag = self.store.statistics_etag()
+        snapshot = self.store.get_statistics()
+
+        self.store.update_book(1, {'title': 'Renamed'})
+        self.assertEqual(self.store.statistics_etag(), etag)
+        self.assertIs(self.store.get_statistics(), snapshot)
+
+        self.store.update_book(1, {'category': 'Other'})
+        self.assertNotEqual(self.store.statistics_etag(), etag)
+        self.assertIsNot(self.store.get_statistics(), snapshot)
+
+    def test_book_etag_follows_revision(self):
+        etag = self.store.book_etag(self.store.get_book(1))
+        # Payload không ghi đè được revision
+        self.store.update_book(1, {'title': 'Renamed', 'revision': 1})
+        self.assertNotEqual(self.store.book_etag(self.store.get_book(1)), etag)
+
+    def test_write_invalidates_book_entries(self):
+        self.cache.set('book-1', 'body', ttl=60, tags=('book:1',))
+        self.store.update_book(1, {'title': 'Renamed'})
+        self.assertIsNone(self.cache.get('book-1'))
+
+    def test_changes_since_keeps_latest_per_book(self):
+        since = self.store.revision
+        self.store.update_book(1, {'title': 'A'})
+        self.store.update_book(1, {'title': 'B'})
+        self.store.delete_book(2)
+
+        changes = self.store.changes_since(since)
+        self.assertEqual([(c['op'], c['id']) for c in changes], [('update', 1), ('delete', 2)])
+        self.assertEqual(changes[0]['book']['title'], 'B')
+        self.assertIsNone(changes[1]['book'])
+        self.assertEqual(self.store.changes_since(self.store.revision), [])
+
+    def test_changes_since_outside_log(self):
+        self.assertIsNone(self.store.changes_since(self.store.revision + 1))
+        with mock.patch.object(cacheable, 'CHANGE_LOG_SIZE', 2):
+            store = CacheableDataStore()
+        store.update_book(1, {'title': 'A'})
+        self.assertIsNone(store.changes_since(0))
+        self.assertEqual([c['op'] for c in store.changes_since(store.changes_floor)], ['update'])
+
+
+class CacheableApiTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.store = CacheableDataStore(cache=self.cache)
+        patches = [mock.patch.object(cacheable, 'db', self.store),
+                   mock.patch.object(cacheable, 'response_cache', self.cache)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = create_app().test_client()
+
+    def test_get_book_returns_body_and_etag(self):
+        response = self.client.get('/api/v4/books/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'HTTP: The Definitive Guide')
+        self.assertEqual(response.headers['ETag'], f'"{self.store.epoch}-1-1"')
+
+        # Lần hai lấy body đã serialize từ cache
+        again = self.client.get('/api/v4/books/1')
+        self.assertEqual(again.get_data(), response.get_data())
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_get_book_not_modified(self):
+        etag = self.client.get('/api/v4/books/1').headers['ETag']
+        response = self.client.get('/api/v4/books/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_update_serves_new_body_under_new_etag(self):
+        first = self.client.get('/api/v4/books/1')
+        response = self.client.put('/api/v4/books/1', json={'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'Renamed')
+
+        response = self.client.get('/api/v4/books/1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'Renamed')
+        self.assertEqual(response.headers['ETag'], f'"{self.store.epoch}-1-2"')
+
+    def test_revalidate_returns_only_changed_and_deleted(self):
+        etags = {book_id: self.client.get(f'/api/v4/books/{book_id}').headers['ETag'] for book_id in (1, 2, 3)}
+        self.store.update_book(1, {'title': 'Renamed'})
+        self.store.delete_book(2)
+
+        response = self.client.post('/api/v4/books/revalidate', json={
+            'books': [{'id': book_id, 'etag': etag} for book_id, etag in etags.items()]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+        body = response.get_json()
+        self.assertEqual([book['id'] for book in body['changed']], [1])
+        self.assertEqual(body['changed'][0]['title'], 'Renamed')
+        self.assertEqual(f'"{body["changed"][0]["etag"]}"',
+                         self.client.get('/api/v4/books/1').headers['ETag'])
+        self.assertEqual(body['deleted'], [2])
+        self.assertEqual(body['unchanged'], 1)
+        self.assertEqual(body['revision'], self.store.revision)
+
+    def test_revalidate_rejects_bad_entries(self):
+        response = self.client.post('/api/v4/books/revalidate', json={'books': [{'etag': 'x'}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_changes_since_revision(self):
+        first = self.client.get('/api/v4/books/changes?since=0').get_json()
+        self.assertEqual([(c['op'], c['id']) for c in first['changes']], [('insert', 1), ('insert', 2), ('insert', 3)])
+        self.assertEqual(first['changes'][0]['book']['title'], 'HTTP: The Definitive Guide')
+
+        self.store.update_book(1, {'title': 'Renamed'})
+        self.store.delete_book(2)
+        response = self.client.get(f"/api/v4/books/changes?since={first['revision']}&epoch={first['epoch']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        body = response.get_json()
+        self.assertEqual(body['revision'], self.store.revision)
+        self.assertEqual([(c['op'], c['id']) for c in body['changes']], [('update', 1), ('delete', 2)])
+        self.assertEqual(body['changes'][0]['book']['title'], 'Renamed')
+        self.assertIsNone(body['changes'][1]['book'])
+
+    def test_changes_gone_for_unknown_epoch_or_revision(self):
+        response = self.client.get('/api/v4/books/changes?since=0&epoch=restarted')
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.get_json()['epoch'], self.store.epoch)
+
+        response = self.client.get(f'/api/v4/books/changes?since={self.store.revision + 1}')
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.client.get('/api/v4/books/changes?since=-1').status_code, 400)
+
+    def test_statistics(self):
+        response = self.client.get('/api/v4/statistics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['total_books'], 3)
+
+        response = self.client.get('/api/v4/statistics', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,398 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+# hash rẻ cho test; phải đặt trước khi import main (main.passwords đọc lúc import)
+os.environ.setdefault("PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+
+from main.extensions import db
+from main.models import Book, Borrow, Copy, User
+from features.book_feature import BookFeature
+from features.borrow_feature import BorrowService
+from features.copy_feature import CopyService
+from features.user_feature import PrincipalCache, UserService
+from main.passwords import PasswordService, PasswordServiceBusy
+import features.user_feature as user_feature
+
+
+def make_app(database_uri):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    db.init_app(app)
+    return app
+
+
+class FeatureTestCase(unittest.TestCase):
+    """Services chạy trên một file sqlite tạm, để test được cả nhiều thread"""
+
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        self.app = make_app("sqlite:///" + self.db_path)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.user = User(username="an", email="an@example.com", password="x")
+        self.book = Book(title="Dune", author="Frank Herbert")
+        db.session.add_all([self.user, self.book])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.ctx.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def count_queries(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        return result, len(statements)
+
+    def add_copies(self, count, book=None):
+        book = book or self.book
+        copies = [Copy(book_id=book.id) for _ in range(count)]
+        db.session.add_all(copies)
+        db.session.commit()
+        return copies
+
+
+class AddBooksTestCase(FeatureTestCase):
+
+    def titles(self):
+        return {book.isbn: book.title for book in Book.query.filter(Book.isbn.isnot(None))}
+
+    def test_inserts_in_batches_and_reports_invalid_rows(self):
+        rows = [{"title": f"Book {i}", "author": "A", "isbn": f"isbn-{i}"} for i in range(5)]
+        rows.insert(2, {"title": "", "author": "A"})
+        rows.append("not a book")
+
+        result = BookFeature.add_books(rows, batch_size=2)
+        self.assertEqual((result["inserted"], result["updated"], result["skipped"]), (5, 0, 0))
+        self.assertEqual([error["index"] for error in result["errors"]], [2, 6])
+        self.assertEqual(len(self.titles()), 5)
+
+    def test_conflicts_skip_or_update(self):
+        BookFeature.add_books([{"title": "Old", "author": "A", "isbn": "1"}])
+        rows = [
+            {"title": "New", "author": "A", "isbn": "1"},
+            {"title": "Twice", "author": "A", "isbn": "2"},
+            {"title": "Twice again", "author": "A", "isbn": "2"},
+        ]
+
+        result = BookFeature.add_books(rows)
+        self.assertEqual((result["inserted"], result["updated"], result["skipped"]), (1, 0, 2))
+        self.assertEqual(self.titles(), {"1": "Old", "2": "Twice"})
+
+        result = BookFeature.add_books(rows + [{"title": "Third", "author": "A", "isbn": "3"},
+                                               {"title": "Third again", "author": "A", "isbn": "3"}],
+                                       on_conflict="update")
+        self.assertEqual((result["inserted"], result["updated"], result["skipped"]), (1, 4, 0))
+        self.assertEqual(self.titles(), {"1": "New", "2": "Twice again", "3": "Third again"})
+
+    def test_rejected_batch_only_counts_written_rows(self):
+        # title là unique: "Dune" đã có nên cả batch rơi về ghi từng dòng
+        rows = [
+            {"title": "A", "author": "A", "isbn": "1"},
+            {"title": "Dune", "author": "A", "isbn": "2"},
+            {"title": "A2", "author": "A", "isbn": "1"},
+        ]
+        result = BookFeature.add_books(rows, on_conflict="update")
+
+        self.assertEqual([error["index"] for error in result["errors"]], [1])
+        # counts của lần ghi cả batch bị bỏ, chỉ đếm những dòng đã commit
+        self.assertEqual((result["inserted"], result["updated"], result["skipped"]), (1, 1, 0))
+        self.assertEqual(self.titles(), {"1": "A2"})
+
+
+class BorrowServiceTestCase(FeatureTestCase):
+
+    def test_borrow_claims_each_copy_once(self):
+        self.add_copies(2)
+
+        first, _ = BorrowService.borrow_copy(self.user.id, self.book.id)
+        second, _ = BorrowService.borrow_copy(self.user.id, self.book.id)
+        third, error = BorrowService.borrow_copy(self.user.id, self.book.id)
+
+        self.assertNotEqual(first.copy_id, second.copy_id)
+        self.assertIsNone(third)
+        self.assertEqual(error, "No available copies")
+        self.assertEqual({copy.status for copy in Copy.query}, {"Borrowed"})
+
+    def test_parallel_borrowers_never_share_a_copy(self):
+        self.add_copies(5)
+        user_id, book_id = self.user.id, self.book.id
+        results = []
+
+        def borrower():
+            with self.app.app_context():
+                borrow, error = BorrowService.borrow_copy(user_id, book_id)
+                results.append(error or borrow.copy_id)
+                db.session.remove()
+
+        threads = [threading.Thread(target=borrower) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [result for result in results if isinstance(result, int)]
+        self.assertEqual(len(claimed), 5)
+        self.assertEqual(len(set(claimed)), 5)
+        self.assertEqual(Borrow.query.count(), 5)
+
+
+class BatchBorrowTestCase(FeatureTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.emma = Book(title="Emma", author="Jane Austen")
+        db.session.add(self.emma)
+        db.session.commit()
+        self.add_copies(2)
+        self.add_copies(1, self.emma)
+        CopyService.reconcile_counters()
+
+    def available(self):
+        db.session.expire_all()
+        return Copy.query.filter_by(status="Available").count()
+
+    def test_all_or_nothing_checkout_rolls_back(self):
+        results, committed = BorrowService.borrow_copies(self.user.id, [self.book.id, self.emma.id, self.emma.id])
+
+        self.assertFalse(committed)
+        self.assertEqual([result["error"] for result in results], ["Rolled back", "Rolled back", "No available copies"])
+        self.assertEqual(self.available(), 3)
+        self.assertEqual(Borrow.query.count(), 0)
+
+    def test_partial_checkout_and_batch_return(self):
+        results, committed = BorrowService.borrow_copies(
+            self.user.id, [self.book.id, self.emma.id, self.emma.id], partial=True
+        )
+        self.assertTrue(committed)
+        self.assertEqual(results[2], {"book_id": self.emma.id, "error": "No available copies"})
+        borrow_ids = [result["borrow_id"] for result in results[:2]]
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(db.session.get(Book, self.emma.id).copies_available, 0)
+
+        results, committed = BorrowService.return_copies(borrow_ids + [999])
+        self.assertFalse(committed)
+        self.assertEqual(self.available(), 1)
+
+        results, committed = BorrowService.return_copies(borrow_ids + [borrow_ids[0]], partial=True)
+        self.assertTrue(committed)
+        self.assertEqual(results[2]["error"], "Copy already returned")
+        self.assertEqual(self.available(), 3)
+        self.assertEqual(db.session.get(Book, self.book.id).copies_available, 2)
+        self.assertEqual(Borrow.query.filter(Borrow.return_date.is_(None)).count(), 0)
+
+    def test_checkout_endpoint(self):
+        from flask_restx import Api
+        from main.borrow_resources import ns
+
+        Api(self.app).add_namespace(ns)
+        client = self.app.test_client()
+
+        response = client.post("/borrows/checkout", json={"user_id": self.user.id, "book_ids": [self.book.id]})
+        self.assertEqual(response.status_code, 200)
+        item = response.get_json()["results"][0]
+        self.assertEqual(set(item), {"book_id", "copy_id", "borrow_id"})
+
+        response = client.post("/borrows/return", json={"borrow_ids": [item["borrow_id"], 999]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["results"][1]["error"], "Borrow record not found")
+
+        self.assertEqual(client.post("/borrows/return", json={"borrow_ids": "x"}).status_code, 400)
+
+
+class BorrowListingTestCase(FeatureTestCase):
+
+    def setUp(self):
+        super().setUp()
+        users = [User(username=f"u{i}", email=f"u{i}@example.com") for i in range(5)]
+        books = [Book(title=f"Book {i}", author="A") for i in range(5)]
+        db.session.add_all(users + books)
+        db.session.commit()
+        copies = [Copy(book_id=books[i % 5].id, status="Borrowed") for i in range(30)]
+        db.session.add_all(copies)
+        db.session.commit()
+        start = datetime(2026, 1, 1)
+        for i, copy in enumerate(copies):
+            db.session.add(Borrow(
+                user_id=users[i % 5].id, copy_id=copy.id, borrow_date=start + timedelta(days=i),
+                return_date=start + timedelta(days=i + 1) if i % 3 == 0 else None,
+            ))
+        db.session.commit()
+        self.user_id = users[0].id
+        db.session.expunge_all()
+
+    def serialize_page(self, limit):
+        borrows, _ = BorrowService.list_borrows_page(limit=limit)
+        # Như một serializer: chạm tới user, copy và copy.book của mọi dòng
+        return [(b.user.email, b.copy.status, b.copy.book.title) for b in borrows]
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        small, small_queries = self.count_queries(lambda: self.serialize_page(2))
+        db.session.expunge_all()
+        large, large_queries = self.count_queries(lambda: self.serialize_page(30))
+
+        self.assertEqual((len(small), len(large)), (2, 30))
+        self.assertEqual(small_queries, large_queries)
+        self.assertLessEqual(large_queries, 2)
+
+    def test_cursor_pages_and_filters(self):
+        seen, cursor = [], 0
+        while True:
+            page, cursor = BorrowService.list_borrows_page(user_id=self.user_id, cursor=cursor, limit=4)
+            seen.extend(borrow.id for borrow in page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(seen, sorted(seen))
+
+        active, _ = BorrowService.list_borrows_page(active_only=True, limit=100)
+        self.assertEqual(len(active), 20)
+        self.assertTrue(all(borrow.return_date is None for borrow in active))
+
+        january, _ = BorrowService.list_borrows_page(
+            borrowed_from=datetime(2026, 1, 10), borrowed_to=datetime(2026, 1, 20), limit=100
+        )
+        self.assertEqual([borrow.borrow_date.day for borrow in january], list(range(10, 20)))
+
+
+class CopyCounterTestCase(FeatureTestCase):
+
+    def counters(self):
+        db.session.expire_all()
+        book = db.session.get(Book, self.book.id)
+        return book.copies_available, book.total_copies
+
+    def test_counters_follow_copies_and_borrows(self):
+        first = CopyService.create_copy(self.book.id)
+        second = CopyService.create_copy(self.book.id)
+        CopyService.create_copy(self.book.id, status="Lost")
+        self.assertEqual(self.counters(), (2, 3))
+
+        borrow, _ = BorrowService.borrow_copy(self.user.id, self.book.id)
+        self.assertEqual(self.counters(), (1, 3))
+
+        self.assertEqual(borrow.copy_id, first.id)
+        BorrowService.admin_update_borrow(borrow.id, copy_id=second.id)
+        self.assertEqual(self.counters(), (1, 3))
+
+        BorrowService.return_copy(borrow.id)
+        self.assertEqual(self.counters(), (2, 3))
+
+        CopyService.update_copy(first.id, status="Damaged")
+        CopyService.delete_copy(second.id)
+        self.assertEqual(self.counters(), (0, 2))
+
+        borrow, error = BorrowService.borrow_copy(self.user.id, self.book.id)
+        self.assertIsNone(borrow)
+        self.assertEqual(self.counters(), (0, 2))
+
+    def test_reconcile_repairs_drifted_counters(self):
+        self.add_copies(3)
+        other = Book(title="Emma", author="Jane Austen", copies_available=9, total_copies=9)
+        db.session.add(other)
+        db.session.commit()
+
+        self.assertEqual(CopyService.reconcile_counters(), 2)
+        self.assertEqual(self.counters(), (3, 3))
+        self.assertEqual((other.copies_available, other.total_copies), (0, 0))
+        self.assertEqual(CopyService.reconcile_counters(), 0)
+
+
+class PrincipalCacheTestCase(FeatureTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, user_feature, "principal_cache", user_feature.principal_cache)
+        user_feature.principal_cache = self.cache = PrincipalCache()
+        UserService.create_user("reader@example.com", "secret")
+
+    def authorize(self):
+        # verify + role + id, như một request cần cả ba
+        with self.app.test_request_context():
+            return (
+                UserService.verify_user("reader@example.com", "secret"),
+                UserService.get_role("reader@example.com"),
+                UserService.get_id("reader@example.com"),
+            )
+
+    def test_one_query_per_user_not_per_lookup(self):
+        (valid, role, user_id), queries = self.count_queries(self.authorize)
+        self.assertEqual((valid, role), (True, "user"))
+        self.assertEqual(queries, 1)
+        self.assertEqual(self.cache.stats["request_hits"], 2)
+
+        # Request sau: lấy từ cache của process, không query
+        _, queries = self.count_queries(self.authorize)
+        self.assertEqual(queries, 0)
+        self.assertEqual(self.cache.queries_avoided(), 5)
+        self.assertEqual(self.cache.by_id(user_id).email, "reader@example.com")
+
+    def test_update_password_invalidates(self):
+        self.authorize()
+        UserService.update_password("reader@example.com", "changed")
+
+        with self.app.test_request_context():
+            self.assertFalse(UserService.verify_user("reader@example.com", "secret"))
+            self.assertTrue(UserService.verify_user("reader@example.com", "changed"))
+        self.assertEqual(self.cache.stats["queries"], 2)
+
+    def test_unknown_user_is_not_cached(self):
+        with self.app.test_request_context():
+            self.assertFalse(UserService.get_id("new@example.com"))
+            UserService.create_user("new@example.com", "pw")
+            self.assertTrue(UserService.get_id("new@example.com"))
+
+    def test_cache_is_bounded(self):
+        cache = PrincipalCache(max_size=2)
+        for i in range(5):
+            UserService.create_user(f"u{i}@example.com", "pw")
+            cache.by_email(f"u{i}@example.com")
+        self.assertEqual(len(cache._entries), 4)
+
+
+
+class PasswordServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.config.update(PASSWORD_VERIFY_WORKERS=1, PASSWORD_VERIFY_MAX_PENDING=1,
+                          PASSWORD_VERIFY_TIMEOUT_SECONDS=0.05)
+        self.passwords = PasswordService("pbkdf2:sha256:1000")
+        self.passwords.init_app(app)
+        self.addCleanup(self.passwords.executor.shutdown)
+
+    def test_hash_and_verify_on_the_pool(self):
+        password_hash = self.passwords.hash("secret")
+        self.assertTrue(self.passwords.verify(password_hash, "secret"))
+        self.assertFalse(self.passwords.verify(password_hash, "wrong"))
+        self.assertFalse(self.passwords.needs_rehash(password_hash))
+        self.assertTrue(PasswordService("scrypt").needs_rehash(password_hash))
+
+    def test_slow_task_times_out_and_keeps_its_slot(self):
+        release = threading.Event()
+        with self.assertRaises(PasswordServiceBusy):
+            self.passwords._run(release.wait, 5)
+        # task vẫn đang chạy nên slot chưa được nhả
+        with self.assertRaises(PasswordServiceBusy):
+            self.passwords.hash("secret")
+        release.set()
+        self.passwords.executor.submit(lambda: None).result()
+        self.assertTrue(self.passwords.hash("secret"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,9 @@
 from flask import Flask
 
 from api.views import blueprint
+from auth.helpers import start_token_compaction
 from auth.views import auth_blueprint
-from extensions import db, migrate, jwt
+from extensions import db, migrate, jwt, passwords
 
 app = Flask(__name__)
 app.register_blueprint(blueprint=blueprint)
@@ -12,6 +13,14 @@ app.config.from_object("config")
 db.init_app(app)
 migrate.init_app(app, db)
 jwt.init_app(app)
+passwords.init_app(app)
+
+if app.config.get("TOKEN_COMPACTION_INTERVAL_SECONDS"):
+    start_token_compaction(
+        app,
+        app.config["TOKEN_COMPACTION_INTERVAL_SECONDS"],
+        app.config.get("TOKEN_COMPACTION_BATCH_SIZE", 1000),
+    )
 
 if __name__ == "__main__":
     app.run(
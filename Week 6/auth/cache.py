@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class RevocationCache:
+    """In-memory view of token_blocklist: jti -> (revoked, expires).
+
+    Filled by add_token_to_database/revoke_token and by DB lookups on a miss.
+    Tokens revoked by other workers are pulled in by a periodic incremental sync.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+        # Sync on token_revocation.id: ids only grow, unlike revoked_at which
+        # depends on commit order and the clocks of the workers writing it
+        self._last_revocation_id = 0
+        self._synced_monotonic = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, jti):
+        """Return the cached revoked flag, or None if the jti is unknown"""
+        with self._lock:
+            entry = self._tokens.get(jti)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, jti, revoked, expires):
+        with self._lock:
+            self._tokens[jti] = (revoked, expires)
+
+    def discard(self, jti):
+        with self._lock:
+            self._tokens.pop(jti, None)
+
+    def start_sync(self, interval_seconds):
+        """Return the last revocation id seen if a new sync is due, otherwise None.
+
+        The first sync returns 0 so every logged revocation gets loaded; pass the
+        highest id read to finish_sync. Expired entries are pruned at the same time;
+        JWT decoding already rejects them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_monotonic is not None and now - self._synced_monotonic < interval_seconds:
+                return None
+            self._synced_monotonic = now
+            # expires is stored in local time (datetime.fromtimestamp)
+            local_now = datetime.now()
+            self._tokens = {
+                jti: entry for jti, entry in self._tokens.items() if entry[1] > local_now
+            }
+            return self._last_revocation_id
+
+    def finish_sync(self, last_revocation_id):
+        with self._lock:
+            self._last_revocation_id = max(self._last_revocation_id, last_revocation_id)
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire after a fixed number of seconds"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,14 +1,30 @@
+import threading
+import time
 from datetime import datetime
 
 from flask_jwt_extended import decode_token
 from sqlalchemy.orm.exc import NoResultFound
 
 from app import app
+from auth.cache import RevocationCache, TTLCache
 from extensions import db
-from models.auth import TokenBlocklist
+from models import User
+from models.auth import TokenBlocklist, TokenRevocation
+
+# Keep the per-request auth checks (blocklist + user lookup) off the database
+revocation_cache = RevocationCache()
+user_cache = TTLCache()
+
+
+def denylist_mode():
+    """Only revoked tokens are stored; unknown jtis are treated as valid"""
+    return app.config.get("JWT_REVOCATION_MODE") == "denylist"
 
 
 def add_token_to_database(encoded_token):
+    if denylist_mode():
+        return
+
     decoded_token = decode_token(encoded_token)
     jti = decoded_token["jti"]
     token_type = decoded_token["type"]
@@ -23,21 +39,137 @@ def add_token_to_database(encoded_token):
     )
     db.session.add(db_token)
     db.session.commit()
+    revocation_cache.set(jti, False, expires)
+
+
+def sync_revocation_cache():
+    """Pull in tokens revoked by other workers since the last sync"""
+    last_id = revocation_cache.start_sync(app.config.get("JWT_REVOCATION_SYNC_SECONDS", 1))
+    if last_id is None:
+        return
+    rows = db.session.query(TokenRevocation.id, TokenRevocation.jti, TokenRevocation.expires).filter(
+        TokenRevocation.id > last_id,
+    )
+    for revocation_id, jti, expires in rows:
+        last_id = max(last_id, revocation_id)
+        if expires > datetime.now():
+            revocation_cache.set(jti, True, expires)
+    revocation_cache.finish_sync(last_id)
 
 
 def is_token_revoked(jwt_payload):
+    sync_revocation_cache()
     jti = jwt_payload["jti"]
+    revoked = revocation_cache.get(jti)
+    if revoked is not None:
+        return revoked
+    if denylist_mode():
+        return False
+
     try:
         token = TokenBlocklist.query.filter_by(jti=jti).one()
-        return token.revoked_at is not None
     except NoResultFound:
         return True
+    revoked = token.revoked_at is not None
+    revocation_cache.set(jti, revoked, token.expires)
+    return revoked
+
 
+def revoke_token(token_jti, user, jwt_payload=None):
+    if denylist_mode():
+        _deny_token(token_jti, user, jwt_payload)
+        return
 
-def revoke_token(token_jti, user):
     try:
         token = TokenBlocklist.query.filter_by(jti=token_jti, user_id=user).one()
         token.revoked_at = datetime.utcnow()
+        db.session.add(TokenRevocation(jti=token_jti, expires=token.expires))
         db.session.commit()
+        revocation_cache.set(token_jti, True, token.expires)
     except NoResultFound:
         raise Exception("Could not find the token {}".format(token_jti))
+
+
+def _deny_token(token_jti, user, jwt_payload):
+    expires = datetime.fromtimestamp(jwt_payload["exp"])
+    token = TokenBlocklist.query.filter_by(jti=token_jti).first()
+    if token is None:
+        token = TokenBlocklist(
+            jti=token_jti,
+            token_type=jwt_payload["type"],
+            user_id=user,
+            expires=expires,
+        )
+        db.session.add(token)
+    token.revoked_at = datetime.utcnow()
+    db.session.add(TokenRevocation(jti=token_jti, expires=expires))
+    db.session.commit()
+    revocation_cache.set(token_jti, True, expires)
+
+
+def purge_expired_tokens(batch_size=1000):
+    """Delete token_blocklist and token_revocation rows past their expiry, batch_size rows per transaction.
+
+    Returns (rows removed, seconds spent).
+    """
+    started = time.perf_counter()
+    # expires is stored in local time, see add_token_to_database
+    now = datetime.now()
+    removed = 0
+    for model in (TokenBlocklist, TokenRevocation):
+        while True:
+            ids = [
+                row_id
+                for (row_id,) in db.session.query(model.id)
+                .filter(model.expires < now)
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            removed += len(ids)
+            if len(ids) < batch_size:
+                break
+    return removed, time.perf_counter() - started
+
+
+def start_token_compaction(flask_app, interval_seconds, batch_size=1000):
+    """Run purge_expired_tokens every interval_seconds on a daemon thread.
+
+    Returns the threading.Event that stops the loop when set.
+    """
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval_seconds):
+            with flask_app.app_context():
+                try:
+                    removed, elapsed = purge_expired_tokens(batch_size)
+                    flask_app.logger.info(
+                        "token compaction: removed %d expired tokens in %.3fs", removed, elapsed
+                    )
+                except Exception:
+                    db.session.rollback()
+                    flask_app.logger.exception("token compaction failed")
+                finally:
+                    db.session.remove()
+
+    threading.Thread(target=run, name="token-compaction", daemon=True).start()
+    return stopped
+
+
+def load_user(user_id):
+    """User for a JWT identity, served from a TTL cache on the hot path.
+
+    The cached instance is kept detached so commits in other requests can't
+    expire it; each request gets its own session-bound copy without a query.
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        db.session.expunge(user)
+        user_cache.set(user_id, user, app.config.get("USER_CACHE_TTL_SECONDS", 60))
+    return db.session.merge(user, load=False)
@@ -0,0 +1,53 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many password verifications are queued or one takes too long"""
+
+
+class PasswordService:
+    """Password hashing with per-environment cost and a bounded verification pool.
+
+    pbkdf2 runs inside hashlib with the GIL released, so a small pool uses all
+    cores while capping how many request threads a login storm can tie up.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.executor = None
+        self._slots = None
+        self.timeout = None
+
+    def init_app(self, app):
+        rounds = app.config.get("PASSWORD_HASH_ROUNDS")
+        if rounds:
+            # min == max == default: hashes made with other rounds are rehashed on login
+            self.context.update(
+                pbkdf2_sha256__default_rounds=rounds,
+                pbkdf2_sha256__min_rounds=rounds,
+                pbkdf2_sha256__max_rounds=rounds,
+            )
+        workers = app.config.get("PASSWORD_VERIFY_WORKERS") or os.cpu_count() or 1
+        max_pending = app.config.get("PASSWORD_VERIFY_MAX_PENDING") or workers * 4
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.timeout = app.config.get("PASSWORD_VERIFY_TIMEOUT_SECONDS", 10)
+
+    def hash(self, password):
+        return self.context.hash(password)
+
+    def verify_and_update(self, password, password_hash):
+        """Return (valid, new_hash); new_hash is set when the stored hash is outdated"""
+        if self.executor is None:
+            return self.context.verify_and_update(password, password_hash)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordServiceBusy()
+        future = self.executor.submit(self.context.verify_and_update, password, password_hash)
+        # Release when the work is done, not when we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordServiceBusy() from None
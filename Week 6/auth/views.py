@@ -1,3 +1,4 @@
+import click
 from flask import request, jsonify, Blueprint
 from flask_jwt_extended import (
     create_access_token,
@@ -9,8 +10,16 @@ from flask_jwt_extended import (
 
 from api.schemas.user import UserCreateSchema, UserSchema
 from app import app
-from auth.helpers import revoke_token, is_token_revoked, add_token_to_database
-from extensions import pwd_context, jwt, db
+from auth.helpers import (
+    revoke_token,
+    is_token_revoked,
+    add_token_to_database,
+    load_user,
+    purge_expired_tokens,
+    user_cache,
+)
+from auth.passwords import PasswordServiceBusy
+from extensions import passwords, jwt, db
 from models import User
 
 auth_blueprint = Blueprint("auth", __name__, url_prefix="/auth")
@@ -25,6 +34,7 @@ def register():
     user = schema.load(request.json)
     db.session.add(user)
     db.session.commit()
+    user_cache.discard(user.id)
 
     schema = UserSchema()
 
@@ -42,8 +52,19 @@ def login():
         return jsonify({"msg": "Missing email or password"}), 400
 
     user = User.query.filter_by(email=email).first()
-    if user is None or not pwd_context.verify(password, user.password):
+    if user is None:
+        return jsonify({"msg": "Bad credentials"}), 400
+    try:
+        valid, new_hash = passwords.verify_and_update(password, user.password)
+    except PasswordServiceBusy:
+        return jsonify({"msg": "Too many login attempts, try again"}), 503, {"Retry-After": "1"}
+    if not valid:
         return jsonify({"msg": "Bad credentials"}), 400
+    if new_hash:
+        # Hash parameters changed since this password was stored: upgrade it
+        user._password = new_hash
+        db.session.commit()
+        user_cache.discard(user.id)
 
     access_token = create_access_token(identity=user.id)
     refresh_token = create_refresh_token(identity=user.id)
@@ -65,25 +86,33 @@ def refresh():
 @auth_blueprint.route("/revoke_access", methods=["DELETE"])
 @jwt_required()
 def revoke_access_token():
-    jti = get_jwt()["jti"]
+    jwt_payload = get_jwt()
     user_identity = get_jwt_identity()
-    revoke_token(jti, user_identity)
+    revoke_token(jwt_payload["jti"], user_identity, jwt_payload)
     return jsonify({"message": "token revoked"}), 200
 
 
 @auth_blueprint.route("/revoke_refresh", methods=["DELETE"])
 @jwt_required(refresh=True)
 def revoke_refresh_token():
-    jti = get_jwt()["jti"]
+    jwt_payload = get_jwt()
     user_identity = get_jwt_identity()
-    revoke_token(jti, user_identity)
+    revoke_token(jwt_payload["jti"], user_identity, jwt_payload)
     return jsonify({"message": "token revoked"}), 200
 
 
+@auth_blueprint.cli.command("purge-tokens")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows deleted per transaction")
+def purge_tokens_command(batch_size):
+    """Delete expired rows from token_blocklist."""
+    removed, elapsed = purge_expired_tokens(batch_size)
+    click.echo(f"Removed {removed} expired tokens in {elapsed:.3f}s")
+
+
 @jwt.user_lookup_loader
 def user_loader_callback(jwt_headers, jwt_payload):
     identity = jwt_payload[app.config["JWT_IDENTITY_CLAIM"]]
-    return User.query.get(identity)
+    return load_user(identity)
 
 
 @jwt.token_in_blocklist_loader
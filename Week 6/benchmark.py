@@ -0,0 +1,58 @@
+"""
+Password verification throughput (the CPU-bound part of /auth/login).
+
+    python benchmark.py --rounds 1000 29000 100000 --workers 1 2 4 --logins 200
+
+Reports logins/sec overall and per worker thread for each PASSWORD_HASH_ROUNDS
+value, going through PasswordService the same way login() does.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+from passlib.context import CryptContext
+
+from auth.passwords import PasswordService
+
+
+def make_service(rounds, workers, logins):
+    app = Flask(__name__)
+    app.config.update(
+        PASSWORD_HASH_ROUNDS=rounds,
+        PASSWORD_VERIFY_WORKERS=workers,
+        PASSWORD_VERIFY_MAX_PENDING=logins,
+    )
+    service = PasswordService(CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto"))
+    service.init_app(app)
+    return service
+
+
+def bench(rounds, workers, logins):
+    service = make_service(rounds, workers, logins)
+    password_hash = service.hash("Secret#123")
+
+    # Simulate request threads all logging in at once
+    with ThreadPoolExecutor(max_workers=logins) as clients:
+        started = time.perf_counter()
+        results = list(clients.map(lambda _: service.verify_and_update("Secret#123", password_hash), range(logins)))
+        elapsed = time.perf_counter() - started
+    service.executor.shutdown()
+
+    assert all(valid and new_hash is None for valid, new_hash in results)
+    return logins / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[1000, 29000, 100000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'rounds':>8} {'workers':>8} {'logins/s':>10} {'per worker':>11}")
+    for rounds in args.rounds:
+        for workers in args.workers:
+            rate = bench(rounds, workers, args.logins)
+            print(f"{rounds:>8} {workers:>8} {rate:>10.1f} {rate / workers:>11.1f}")
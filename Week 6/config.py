@@ -11,3 +11,19 @@ SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI")
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
 JWT_TOKEN_LOCATION = ["headers"]
 JWT_IDENTITY_CLAIM = "user_id"  # default == sub
+# allowlist: every issued token is stored, unknown jtis are revoked (default)
+# denylist: only revoked tokens are stored, login/refresh don't write to the DB
+JWT_REVOCATION_MODE = os.environ.get("JWT_REVOCATION_MODE", "allowlist")
+# Workers cache token checks and pull revocations made by other workers from
+# token_revocation at most this often, so a token revoked elsewhere can stay
+# valid here for up to this many seconds. Each sync is one indexed query for
+# the new rows only; 0 checks on every request
+JWT_REVOCATION_SYNC_SECONDS = int(os.environ.get("JWT_REVOCATION_SYNC_SECONDS", 1))
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+# 0 disables the background thread; "flask auth purge-tokens" still works
+TOKEN_COMPACTION_INTERVAL_SECONDS = int(os.environ.get("TOKEN_COMPACTION_INTERVAL_SECONDS", 0))
+TOKEN_COMPACTION_BATCH_SIZE = int(os.environ.get("TOKEN_COMPACTION_BATCH_SIZE", 1000))
+# pbkdf2_sha256 cost; keep it low in development/tests, high in production
+PASSWORD_HASH_ROUNDS = int(os.environ.get("PASSWORD_HASH_ROUNDS", 29000))
+PASSWORD_VERIFY_WORKERS = int(os.environ.get("PASSWORD_VERIFY_WORKERS", os.cpu_count() or 1))
+PASSWORD_VERIFY_MAX_PENDING = int(os.environ.get("PASSWORD_VERIFY_MAX_PENDING", 4 * (os.cpu_count() or 1)))
@@ -4,8 +4,11 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from passlib.context import CryptContext
 
+from auth.passwords import PasswordService
+
 db = SQLAlchemy()
 migrate = Migrate()
 ma = Marshmallow()
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+passwords = PasswordService(pwd_context)
 jwt = JWTManager()
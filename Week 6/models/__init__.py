@@ -1,9 +1,10 @@
 from models.users import User
 from models.forum import Post
-from models.auth import TokenBlocklist
+from models.auth import TokenBlocklist, TokenRevocation
 
 __all__ = [
     "User",
     "Post",
-    "TokenBlocklist"
+    "TokenBlocklist",
+    "TokenRevocation",
 ]
@@ -7,6 +7,17 @@ class TokenBlocklist(db.Model):
     token_type = db.Column(db.String(10), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     revoked_at = db.Column(db.DateTime)
-    expires = db.Column(db.DateTime, nullable=False)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
 
     user = db.relationship("User")
+
+
+class TokenRevocation(db.Model):
+    """Append-only log of revocations; workers sync their caches on id, not on time"""
+
+    # AUTOINCREMENT so SQLite never hands out an id again after purging the newest rows
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    jti = db.Column(db.String(36), nullable=False)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
@@ -11,6 +11,9 @@ from library_api.models.delete_book200_response import DeleteBook200Response  #
 from library_api.models.error import Error  # noqa: E501
 from library_api.models.get_books200_response import GetBooks200Response  # noqa: E501
 from library_api import util
+from library_api.database import (
+    BULK_BATCH_SIZE, Book as BookDB, book_fts, bulk_upsert_books, db, filter_by_search, validate_book_row
+)
 
 
 def get_books():
@@ -55,6 +58,40 @@ def create_book(body):
         return {'message': str(e)}, 500
 
 
+def bulk_create_books(body, on_conflict=None):
+    """Create many books
+    
+    :param body: Array of book data
+    :type body: list
+    :param on_conflict: What to do with a row whose isbn already exists
+    :type on_conflict: str
+    
+    :rtype: dict
+    """
+    on_conflict = on_conflict or 'skip'
+    result = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    try:
+        batch = []
+        for index, row in enumerate(body):
+            book, error = validate_book_row(row)
+            if error:
+                result['errors'].append({'index': index, 'error': error})
+            else:
+                batch.append((index, book))
+            if batch and (len(batch) >= BULK_BATCH_SIZE or index == len(body) - 1):
+                counts, errors = bulk_upsert_books(batch, on_conflict)
+                for key, value in counts.items():
+                    result[key] += value
+                result['errors'].extend(errors)
+                batch = []
+
+        result['errors'].sort(key=lambda error: error['index'])
+        return result, 200
+    except Exception as e:
+        db.session.rollback()
+        return {'message': str(e)}, 500
+
+
 def get_book_by_id(id):
     """Get a book by id
     
@@ -151,13 +188,9 @@ def search_books(q=None, page=None, per_page=None):
         query = BookDB.query
         
         if search_query:
-            search_pattern = f'%{search_query}%'
-            query = query.filter(
-                db.or_(
-                    BookDB.title.ilike(search_pattern),
-                    BookDB.author.ilike(search_pattern)
-                )
-            )
+            query, ranked = filter_by_search(query, search_query)
+            if ranked:
+                query = query.order_by(book_fts.c.rank, BookDB.id)
         
         paginated_books = query.paginate(page=page, per_page=per_page, error_out=False)
         
@@ -1,7 +1,10 @@
 # library_api/database.py
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import column, event, exc, inspect, literal_column, table
 from datetime import datetime
 import os
+import re
 
 db = SQLAlchemy()
 
@@ -9,13 +12,27 @@ basedir = os.path.dirname(os.path.realpath(__file__))
 
 def init_db(app):
     """Initialize database with app"""
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, '../books.db')
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + os.path.join(basedir, '../books.db'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_ECHO'] = True
+    # auto: FTS5 when the backend supports it, like: always ILIKE
+    app.config.setdefault('BOOK_SEARCH_BACKEND', 'auto')
     db.init_app(app)
     
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as connection:
+            upgrade_book_table(connection)
+
+
+def upgrade_book_table(connection):
+    """Add columns that create_all won't add to an existing book table"""
+    inspector = inspect(connection)
+    if not inspector.has_table('book'):
+        return
+    if 'isbn' not in {c['name'] for c in inspector.get_columns('book')}:
+        connection.exec_driver_sql('ALTER TABLE book ADD COLUMN isbn VARCHAR(20)')
+    connection.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS ix_book_isbn ON book (isbn)')
 
 class Book(db.Model):
     __tablename__ = 'book'
@@ -24,6 +41,7 @@ class Book(db.Model):
     title = db.Column(db.String(80), nullable=False)
     author = db.Column(db.String(40), nullable=False)
     date_added = db.Column(db.DateTime(), default=datetime.utcnow)
+    isbn = db.Column(db.String(20), unique=True, index=True)
 
     def __repr__(self):
         return f'<Book {self.title}>'
@@ -34,5 +52,188 @@ class Book(db.Model):
             'id': self.id,
             'title': self.title,
             'author': self.author,
-            'date_joined': self.date_added.isoformat() if self.date_added else None
-        }
\ No newline at end of file
+            'date_joined': self.date_added.isoformat() if self.date_added else None,
+            'isbn': self.isbn
+        }
+
+
+# --- Book search (FTS5) -------------------------------------------------------
+# Week4/app.py, Week 8/app.py and Week 7 library_api/database.py are separate
+# apps with no shared package, so each carries this block. The copies are kept
+# identical on purpose (Week 8/test_app.py checks it): change all three together.
+
+# Full-text index over title/author, kept in sync by triggers on the book table.
+# External content: the FTS table only stores the index, rows live in book.
+BOOK_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, author, content='book', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+
+book_fts = table('book_fts', column('rowid'), column('rank'))
+
+# engine -> whether book_fts exists, so searches don't re-check sqlite_master
+_fts_ready = {}
+
+
+def sqlite_supports_fts5(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+    return 'ENABLE_FTS5' in options
+
+
+@event.listens_for(Book.__table__, 'after_create')
+def create_book_fts(target, connection, **kw):
+    ''' Create and backfill the FTS index whenever the book table is created '''
+    ready = sqlite_supports_fts5(connection)
+    if ready:
+        for statement in BOOK_FTS_DDL:
+            connection.exec_driver_sql(statement)
+    _fts_ready[connection.engine] = ready
+
+
+@event.listens_for(Book.__table__, 'before_drop')
+def drop_book_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS book_fts')
+    _fts_ready[connection.engine] = False
+
+
+def fts_enabled():
+    if current_app.config.get('BOOK_SEARCH_BACKEND', 'auto') == 'like':
+        return False
+    engine = db.engine
+    if engine not in _fts_ready:
+        with engine.connect() as connection:
+            _fts_ready[engine] = connection.dialect.name == 'sqlite' and connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'"
+            ).first() is not None
+    return _fts_ready[engine]
+
+
+def fts_match_expression(search_query):
+    ''' Turn free text into an FTS5 query: every word must match as a token prefix '''
+    return ' '.join(f'"{token}"*' for token in re.findall(r'\w+', search_query))
+
+
+def filter_by_search(query, search_query):
+    '''
+    Restrict a Book query to rows matching search_query.
+    Returns the query and whether it was joined to book_fts (so callers can order by rank).
+    '''
+    match = fts_match_expression(search_query)
+    if match and fts_enabled():
+        query = query.join(book_fts, book_fts.c.rowid == Book.id).filter(
+            literal_column('book_fts').op('MATCH')(match)
+        )
+        return query, True
+
+    search_pattern = f'%{search_query}%'
+    query = query.filter(
+        db.or_(
+            Book.title.ilike(search_pattern),
+            Book.author.ilike(search_pattern)
+        )
+    )
+    return query, False
+
+# --- end book search ----------------------------------------------------------
+
+
+# --- Book bulk upsert ---------------------------------------------------------
+# Same arrangement as the search block: Week 8/app.py and Week 7
+# library_api/database.py keep identical copies (Week 8/test_app.py checks it).
+
+# Rows per transaction
+BULK_BATCH_SIZE = 500
+
+
+def validate_book_row(row):
+    ''' Return (book mapping, None) for a valid row, or (None, error message) '''
+    if not isinstance(row, dict):
+        return None, 'Expected a JSON object'
+    book = {}
+    for name, column in (('title', Book.title), ('author', Book.author), ('isbn', Book.isbn)):
+        value = row.get(name)
+        if value is None and name == 'isbn':
+            continue
+        if not isinstance(value, str) or not value.strip():
+            return None, f"'{name}' must be a non-empty string"
+        if len(value) > column.type.length:
+            return None, f"'{name}' is longer than {column.type.length} characters"
+        book[name] = value
+    return book, None
+
+
+def write_book_batch(rows, on_conflict):
+    '''
+    Write (index, mapping) rows in a single transaction and return the counts.
+    A row whose isbn exists (in the table or earlier in the batch) is skipped or
+    updated depending on on_conflict.
+    '''
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    isbns = [book['isbn'] for _, book in rows if book.get('isbn')]
+    existing = dict(
+        db.session.query(Book.isbn, Book.id).filter(Book.isbn.in_(isbns)).all()
+    ) if isbns else {}
+
+    inserts, updates, pending = [], [], {}
+    for _, book in rows:
+        isbn = book.get('isbn')
+        if isbn in existing:
+            if on_conflict == 'update':
+                updates.append(dict(book, id=existing[isbn]))
+                counts['updated'] += 1
+            else:
+                counts['skipped'] += 1
+        elif isbn in pending:
+            # Same isbn twice in one batch: the later row wins on update
+            if on_conflict == 'update':
+                pending[isbn].update(book)
+                counts['updated'] += 1
+            else:
+                counts['skipped'] += 1
+        else:
+            inserts.append(dict(book))
+            counts['inserted'] += 1
+            if isbn:
+                pending[isbn] = inserts[-1]
+
+    try:
+        db.session.bulk_insert_mappings(Book, inserts)
+        db.session.bulk_update_mappings(Book, updates)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def bulk_upsert_books(rows, on_conflict):
+    ''' Write one batch; if the database rejects it, retry row by row. Returns (counts, errors) '''
+    try:
+        return write_book_batch(rows, on_conflict), []
+    except exc.SQLAlchemyError:
+        pass
+
+    # Only the offending rows are reported, everything else is kept
+    counts, errors = {'inserted': 0, 'updated': 0, 'skipped': 0}, []
+    for index, book in rows:
+        try:
+            row_counts = write_book_batch([(index, book)], on_conflict)
+        except exc.SQLAlchemyError as e:
+            errors.append({'index': index, 'error': str(getattr(e, 'orig', None) or e)})
+            continue
+        for key, value in row_counts.items():
+            counts[key] += value
+    return counts, errors
+
+# --- end book bulk upsert ----------------------------------------------------
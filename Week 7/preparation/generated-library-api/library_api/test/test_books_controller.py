@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 from flask import json
@@ -9,6 +11,7 @@ from library_api.models.create_book201_response import CreateBook201Response  #
 from library_api.models.delete_book200_response import DeleteBook200Response  # noqa: E501
 from library_api.models.error import Error  # noqa: E501
 from library_api.models.get_books200_response import GetBooks200Response  # noqa: E501
+from library_api.database import Book as BookDB, db, init_db
 from library_api.test import BaseTestCase
 
 
@@ -118,5 +121,63 @@ class TestBooksController(BaseTestCase):
                        'Response body is : ' + response.data.decode('utf-8'))
 
 
+
+class TestBulkCreateBooks(BaseTestCase):
+    """bulk_create_books against a scratch database"""
+
+    def create_app(self):
+        app = super().create_app()
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.db_path
+        init_db(app)
+        return app
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def bulk(self, rows, on_conflict='skip'):
+        response = self.client.open(
+            '/books/bulk',
+            method='POST',
+            query_string=[('on_conflict', on_conflict)],
+            data=json.dumps(rows),
+            content_type='application/json')
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+        return response.json
+
+    def titles(self):
+        return {book.isbn: book.title for book in BookDB.query.all()}
+
+    def test_bulk_create_books(self):
+        rows = [
+            {"title": "The Hobbit", "author": "J.R.R. Tolkien", "isbn": "1"},
+            {"title": "", "author": "Nobody"},
+            {"title": "Dune", "author": "Frank Herbert", "isbn": "2"},
+            {"title": "Dune Messiah", "author": "Frank Herbert", "isbn": "2"},
+        ]
+        result = self.bulk(rows)
+        self.assertEqual((result['inserted'], result['updated'], result['skipped']), (2, 0, 1))
+        self.assertEqual([error['index'] for error in result['errors']], [1])
+        self.assertEqual(self.titles(), {"1": "The Hobbit", "2": "Dune"})
+
+        result = self.bulk(rows, on_conflict='update')
+        self.assertEqual((result['inserted'], result['updated'], result['skipped']), (0, 3, 0))
+        self.assertEqual(self.titles(), {"1": "The Hobbit", "2": "Dune Messiah"})
+
+    def test_bulk_create_books_rejects_unknown_on_conflict(self):
+        response = self.client.open(
+            '/books/bulk',
+            method='POST',
+            query_string=[('on_conflict', 'merge')],
+            data=json.dumps([]),
+            content_type='application/json')
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
 if __name__ == '__main__':
     unittest.main()
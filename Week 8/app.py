@@ -1,8 +1,13 @@
-from flask import Flask, jsonify, request
-from flask_restx import Api, Resource, fields
+from flask import Flask, current_app, jsonify, request
+from flask_restx import Api, Resource, fields, marshal
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import column, event, exc, inspect, literal_column, table
+import base64
+import binascii
+import json
 import os
+import re
 from datetime import datetime
 
 basedir = os.path.dirname(os.path.realpath(__file__))
@@ -10,9 +15,11 @@ basedir = os.path.dirname(os.path.realpath(__file__))
 app = Flask(__name__)
 CORS(app)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'books.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'books.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = True
+# auto: FTS5 when the backend supports it, like: always ILIKE
+app.config['BOOK_SEARCH_BACKEND'] = 'auto'
 
 api = Api(app, doc='/', title="Library Management API", description="DEMO")
 
@@ -23,10 +30,130 @@ class Book(db.Model):
     title = db.Column(db.String(80), nullable=False)
     author = db.Column(db.String(40), nullable=False)
     date_added = db.Column(db.DateTime(), default=datetime.utcnow)
+    isbn = db.Column(db.String(20), unique=True, index=True)
+
+    # Composite indexes so cursor pagination can seek on (sort_key, id)
+    __table_args__ = (
+        db.Index('ix_book_title_id', 'title', 'id'),
+        db.Index('ix_book_date_added_id', 'date_added', 'id'),
+    )
 
     def __repr__(self):
         return self.title
 
+# --- Book search (FTS5) -------------------------------------------------------
+# Week4/app.py, Week 8/app.py and Week 7 library_api/database.py are separate
+# apps with no shared package, so each carries this block. The copies are kept
+# identical on purpose (Week 8/test_app.py checks it): change all three together.
+
+# Full-text index over title/author, kept in sync by triggers on the book table.
+# External content: the FTS table only stores the index, rows live in book.
+BOOK_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, author, content='book', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+
+book_fts = table('book_fts', column('rowid'), column('rank'))
+
+# engine -> whether book_fts exists, so searches don't re-check sqlite_master
+_fts_ready = {}
+
+
+def sqlite_supports_fts5(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+    return 'ENABLE_FTS5' in options
+
+
+@event.listens_for(Book.__table__, 'after_create')
+def create_book_fts(target, connection, **kw):
+    ''' Create and backfill the FTS index whenever the book table is created '''
+    ready = sqlite_supports_fts5(connection)
+    if ready:
+        for statement in BOOK_FTS_DDL:
+            connection.exec_driver_sql(statement)
+    _fts_ready[connection.engine] = ready
+
+
+@event.listens_for(Book.__table__, 'before_drop')
+def drop_book_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS book_fts')
+    _fts_ready[connection.engine] = False
+
+
+def fts_enabled():
+    if current_app.config.get('BOOK_SEARCH_BACKEND', 'auto') == 'like':
+        return False
+    engine = db.engine
+    if engine not in _fts_ready:
+        with engine.connect() as connection:
+            _fts_ready[engine] = connection.dialect.name == 'sqlite' and connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'"
+            ).first() is not None
+    return _fts_ready[engine]
+
+
+def fts_match_expression(search_query):
+    ''' Turn free text into an FTS5 query: every word must match as a token prefix '''
+    return ' '.join(f'"{token}"*' for token in re.findall(r'\w+', search_query))
+
+
+def filter_by_search(query, search_query):
+    '''
+    Restrict a Book query to rows matching search_query.
+    Returns the query and whether it was joined to book_fts (so callers can order by rank).
+    '''
+    match = fts_match_expression(search_query)
+    if match and fts_enabled():
+        query = query.join(book_fts, book_fts.c.rowid == Book.id).filter(
+            literal_column('book_fts').op('MATCH')(match)
+        )
+        return query, True
+
+    search_pattern = f'%{search_query}%'
+    query = query.filter(
+        db.or_(
+            Book.title.ilike(search_pattern),
+            Book.author.ilike(search_pattern)
+        )
+    )
+    return query, False
+
+# --- end book search ----------------------------------------------------------
+
+
+# engines whose book table has been checked for columns added after it was created
+_schema_ready = set()
+
+
+def upgrade_book_table(connection):
+    ''' Databases created before bulk upsert have no isbn column; create_all won't add it '''
+    inspector = inspect(connection)
+    if not inspector.has_table('book'):
+        return
+    if 'isbn' not in {c['name'] for c in inspector.get_columns('book')}:
+        connection.exec_driver_sql('ALTER TABLE book ADD COLUMN isbn VARCHAR(20)')
+    connection.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS ix_book_isbn ON book (isbn)')
+
+
+@app.before_request
+def ensure_book_schema():
+    engine = db.engine
+    if engine not in _schema_ready:
+        with engine.begin() as connection:
+            upgrade_book_table(connection)
+        _schema_ready.add(engine)
+
 book_model = api.model(
     'Book',
     {
@@ -34,9 +161,115 @@ book_model = api.model(
         'title': fields.String(),
         'author': fields.String(),
         'date_joined': fields.String(),
+        'isbn': fields.String(),
+    }
+)
+
+book_bulk_result_model = api.model(
+    'BookBulkResult',
+    {
+        'inserted': fields.Integer(),
+        'updated': fields.Integer(),
+        'skipped': fields.Integer(),
+        'errors': fields.List(fields.Raw(), description='One {index, error} entry per rejected row'),
+    }
+)
+
+book_page_model = api.model(
+    'BookPage',
+    {
+        'books': fields.List(fields.Nested(book_model)),
+        'total': fields.Integer(),
+        'pages': fields.Integer(),
+        'current_page': fields.Integer(),
+    }
+)
+
+book_cursor_page_model = api.model(
+    'BookCursorPage',
+    {
+        'books': fields.List(fields.Nested(book_model)),
+        'total': fields.Integer(description='Only computed when include_total=true'),
+        'next_cursor': fields.String(),
+        'prev_cursor': fields.String(),
+        'limit': fields.Integer(),
     }
 )
 
+MAX_PAGE_SIZE = 100
+
+# Columns the cursor mode can sort on; each is paired with Book.id as tie-breaker
+CURSOR_SORT_COLUMNS = {
+    'id': Book.id,
+    'title': Book.title,
+    'date_added': Book.date_added,
+}
+
+
+def encode_cursor(book, sort, direction):
+    ''' Encode the (sort_key, id) position of a book as an opaque token '''
+    key = getattr(book, sort)
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    payload = json.dumps({'s': sort, 'k': key, 'i': book.id, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    ''' Decode a cursor token, raising ValueError if it was tampered with '''
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort, key, last_id, direction = payload['s'], payload['k'], int(payload['i']), payload['d']
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+    if sort not in CURSOR_SORT_COLUMNS or direction not in ('next', 'prev'):
+        raise ValueError('Invalid cursor')
+    if sort == 'date_added':
+        key = datetime.fromisoformat(key)
+    return sort, key, last_id, direction
+
+
+def paginate_by_cursor(query, sort, cursor, limit):
+    '''
+    Keyset pagination: seek past the last seen (sort_key, id) with an indexed
+    WHERE clause instead of OFFSET, so every page costs the same.
+    '''
+    direction = 'next'
+    if cursor:
+        sort, key, last_id, direction = decode_cursor(cursor)
+    column = CURSOR_SORT_COLUMNS[sort]
+
+    if cursor:
+        if sort == 'id':
+            seek = Book.id > last_id if direction == 'next' else Book.id < last_id
+        elif direction == 'next':
+            seek = db.or_(column > key, db.and_(column == key, Book.id > last_id))
+        else:
+            seek = db.or_(column < key, db.and_(column == key, Book.id < last_id))
+        query = query.filter(seek)
+
+    if direction == 'next':
+        query = query.order_by(column.asc(), Book.id.asc())
+    else:
+        query = query.order_by(column.desc(), Book.id.desc())
+
+    # Fetch one extra row to know whether another page exists
+    books = query.limit(limit + 1).all()
+    has_more = len(books) > limit
+    books = books[:limit]
+    if direction == 'prev':
+        books.reverse()
+
+    has_next = has_more if direction == 'next' else bool(cursor)
+    has_prev = bool(cursor) if direction == 'next' else has_more
+    return {
+        'books': books,
+        'next_cursor': encode_cursor(books[-1], sort, 'next') if books and has_next else None,
+        'prev_cursor': encode_cursor(books[0], sort, 'prev') if books and has_prev else None,
+        'limit': limit,
+    }
+
 @api.route('/books')
 class Books(Resource):
     @api.marshal_list_with(book_model, code=200, envelope="books")
@@ -51,11 +284,163 @@ class Books(Resource):
         data = request.get_json()
         title = data.get('title')
         author = data.get('author')
-        new_book = Book(title=title, author=author)
+        new_book = Book(title=title, author=author, isbn=data.get('isbn'))
         db.session.add(new_book)
         db.session.commit()
         return new_book
 
+# Rows per transaction for /books/bulk
+def read_bulk_rows():
+    ''' Yield rows from a JSON array body or, line by line, from an NDJSON body '''
+    if 'ndjson' in (request.content_type or ''):
+        for line in request.stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+        return
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        api.abort(400, 'Body must be a JSON array or NDJSON')
+    yield from rows
+
+
+# --- Book bulk upsert ---------------------------------------------------------
+# Same arrangement as the search block: Week 8/app.py and Week 7
+# library_api/database.py keep identical copies (Week 8/test_app.py checks it).
+
+# Rows per transaction
+BULK_BATCH_SIZE = 500
+
+
+def validate_book_row(row):
+    ''' Return (book mapping, None) for a valid row, or (None, error message) '''
+    if not isinstance(row, dict):
+        return None, 'Expected a JSON object'
+    book = {}
+    for name, column in (('title', Book.title), ('author', Book.author), ('isbn', Book.isbn)):
+        value = row.get(name)
+        if value is None and name == 'isbn':
+            continue
+        if not isinstance(value, str) or not value.strip():
+            return None, f"'{name}' must be a non-empty string"
+        if len(value) > column.type.length:
+            return None, f"'{name}' is longer than {column.type.length} characters"
+        book[name] = value
+    return book, None
+
+
+def write_book_batch(rows, on_conflict):
+    '''
+    Write (index, mapping) rows in a single transaction and return the counts.
+    A row whose isbn exists (in the table or earlier in the batch) is skipped or
+    updated depending on on_conflict.
+    '''
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    isbns = [book['isbn'] for _, book in rows if book.get('isbn')]
+    existing = dict(
+        db.session.query(Book.isbn, Book.id).filter(Book.isbn.in_(isbns)).all()
+    ) if isbns else {}
+
+    inserts, updates, pending = [], [], {}
+    for _, book in rows:
+        isbn = book.get('isbn')
+        if isbn in existing:
+            if on_conflict == 'update':
+                updates.append(dict(book, id=existing[isbn]))
+                counts['updated'] += 1
+            else:
+                counts['skipped'] += 1
+        elif isbn in pending:
+            # Same isbn twice in one batch: the later row wins on update
+            if on_conflict == 'update':
+                pending[isbn].update(book)
+                counts['updated'] += 1
+            else:
+                counts['skipped'] += 1
+        else:
+            inserts.append(dict(book))
+            counts['inserted'] += 1
+            if isbn:
+                pending[isbn] = inserts[-1]
+
+    try:
+        db.session.bulk_insert_mappings(Book, inserts)
+        db.session.bulk_update_mappings(Book, updates)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def bulk_upsert_books(rows, on_conflict):
+    ''' Write one batch; if the database rejects it, retry row by row. Returns (counts, errors) '''
+    try:
+        return write_book_batch(rows, on_conflict), []
+    except exc.SQLAlchemyError:
+        pass
+
+    # Only the offending rows are reported, everything else is kept
+    counts, errors = {'inserted': 0, 'updated': 0, 'skipped': 0}, []
+    for index, book in rows:
+        try:
+            row_counts = write_book_batch([(index, book)], on_conflict)
+        except exc.SQLAlchemyError as e:
+            errors.append({'index': index, 'error': str(getattr(e, 'orig', None) or e)})
+            continue
+        for key, value in row_counts.items():
+            counts[key] += value
+    return counts, errors
+
+# --- end book bulk upsert ----------------------------------------------------
+
+@api.route('/books/bulk')
+class BooksBulk(Resource):
+    @api.doc(params={
+        'on_conflict': {
+            'description': 'What to do with a row whose isbn already exists',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['skip', 'update'],
+            'default': 'skip'
+        }
+    })
+    @api.response(200, 'Success', book_bulk_result_model)
+    def post(self):
+        ''' Create many books from a JSON array or NDJSON body '''
+        on_conflict = request.args.get('on_conflict', 'skip', type=str)
+        if on_conflict not in ('skip', 'update'):
+            api.abort(400, f"Unsupported on_conflict '{on_conflict}'")
+
+        result = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+
+        def flush(batch):
+            counts, errors = bulk_upsert_books(batch, on_conflict)
+            for key, value in counts.items():
+                result[key] += value
+            result['errors'].extend(errors)
+
+        batch = []
+        for index, row in enumerate(read_bulk_rows()):
+            if isinstance(row, ValueError):
+                result['errors'].append({'index': index, 'error': f'Invalid JSON: {row}'})
+                continue
+            book, error = validate_book_row(row)
+            if error:
+                result['errors'].append({'index': index, 'error': error})
+                continue
+            batch.append((index, book))
+            if len(batch) >= BULK_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        result['errors'].sort(key=lambda error: error['index'])
+        return marshal(result, book_bulk_result_model), 200
+
 @api.route('/book/<int:id>')
 class BookResource(Resource):
     @api.marshal_with(book_model, code=200, envelope="book")
@@ -86,7 +471,7 @@ class BookResource(Resource):
 class BookSearch(Resource):
     @api.doc(params={
         'q': {
-            'description': 'Title or author',
+            'description': 'Title or author words (prefix match, ranked when full-text search is available)',
             'in': 'query',
             'type': 'string',
             'default': ''
@@ -102,33 +487,84 @@ class BookSearch(Resource):
             'in': 'query',
             'type': 'integer',
             'default': 10
+        },
+        'mode': {
+            'description': 'Pagination mode: page or cursor (implied when a cursor is given)',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['page', 'cursor'],
+            'default': 'page'
+        },
+        'cursor': {
+            'description': 'Opaque next_cursor/prev_cursor token from a previous response',
+            'in': 'query',
+            'type': 'string'
+        },
+        'limit': {
+            'description': 'Number of items to return in cursor mode',
+            'in': 'query',
+            'type': 'integer',
+            'default': 10
+        },
+        'sort': {
+            'description': 'Sort key for cursor mode',
+            'in': 'query',
+            'type': 'string',
+            'enum': list(CURSOR_SORT_COLUMNS),
+            'default': 'id'
+        },
+        'include_total': {
+            'description': 'Also run COUNT(*) in cursor mode',
+            'in': 'query',
+            'type': 'boolean',
+            'default': False
         }
     })
-    
-    @api.marshal_list_with(book_model, code=200, envelope="books")
+    @api.response(200, 'Success', book_page_model)
     def get(self):
-        ''' Search books by title or author with pagination '''
+        ''' Search books by title or author with page or cursor pagination '''
         search_query = request.args.get('q', '', type=str)
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        cursor = request.args.get('cursor', '', type=str)
+        mode = 'cursor' if cursor else request.args.get('mode', 'page', type=str)
 
         query = Book.query
+        ranked = False
         if search_query:
-            search_pattern = f'%{search_query}%'
-            query = query.filter(
-                db.or_(
-                    Book.title.ilike(search_pattern),
-                    Book.author.ilike(search_pattern)
-                )
-            )
+            query, ranked = filter_by_search(query, search_query)
+
+        if mode == 'cursor':
+            limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_PAGE_SIZE)
+            sort = request.args.get('sort', 'id', type=str)
+            if sort not in CURSOR_SORT_COLUMNS:
+                api.abort(400, f"Unsupported sort key '{sort}'")
+            include_total = request.args.get('include_total', 'false').lower() in ('1', 'true', 'yes')
 
+            try:
+                result = paginate_by_cursor(query, sort, cursor, limit)
+            except ValueError as e:
+                api.abort(400, str(e))
+            result['total'] = query.order_by(None).count() if include_total else None
+            return marshal(result, book_cursor_page_model), 200
+
+        if ranked:
+            query = query.order_by(book_fts.c.rank, Book.id)
         paginated_books = query.paginate(page=page, per_page=per_page, error_out=False)
-        return {
+        return marshal({
             'books': paginated_books.items,
             'total': paginated_books.total,
             'pages': paginated_books.pages,
             'current_page': paginated_books.page
-        }
+        }, book_page_model), 200
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    ''' Create the FTS index on an existing database and backfill it '''
+    with db.engine.begin() as connection:
+        upgrade_book_table(connection)
+        create_book_fts(Book.__table__, connection)
+    print('Full-text search enabled' if fts_enabled() else 'FTS5 not supported, using ILIKE search')
 
 @app.shell_context_processor
 def make_shell_context():
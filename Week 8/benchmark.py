@@ -0,0 +1,147 @@
+'''
+Micro-benchmarks for the Library API data paths.
+
+    python benchmark.py search --sizes 10000 100000 1000000
+    python benchmark.py bulk --rows 5000
+'''
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+# The bulk benchmark goes through the Flask app; keep it away from the real books.db
+BENCH_DB_PATH = os.path.join(tempfile.gettempdir(), 'library-benchmark.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + BENCH_DB_PATH
+
+from app import BOOK_FTS_DDL, app, db, fts_match_expression
+
+WORDS = [
+    'river', 'shadow', 'garden', 'winter', 'empire', 'silent', 'engine', 'ocean', 'crystal',
+    'forest', 'memory', 'harbor', 'signal', 'hollow', 'marble', 'violet', 'thunder', 'lantern',
+    'compass', 'orchard', 'falcon', 'meadow', 'ember', 'glacier', 'canyon', 'velvet', 'atlas',
+]
+SURNAMES = ['Orwell', 'Tolkien', 'Austen', 'Dickens', 'Tanaka', 'Nguyen', 'Garcia', 'Kowalski', 'Okafor']
+
+# The SQL Book.query.paginate issues for each backend: one COUNT plus one page
+LIKE_SQL = (
+    "FROM book WHERE lower(title) LIKE lower(:pattern) OR lower(author) LIKE lower(:pattern)",
+    "SELECT id, title, author {} ORDER BY id LIMIT 10",
+)
+FTS_SQL = (
+    "FROM book JOIN book_fts ON book_fts.rowid = book.id WHERE book_fts MATCH :match",
+    "SELECT book.id, book.title, book.author {} ORDER BY book_fts.rank, book.id LIMIT 10",
+)
+
+
+def build_catalog(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR(80) NOT NULL, "
+        "author VARCHAR(40) NOT NULL, date_added DATETIME)"
+    )
+    rng = random.Random(rows)
+    batch = []
+    for i in range(rows):
+        title = ' '.join(rng.choice(WORDS) for _ in range(3)).title()
+        author = f'{rng.choice("ABCDEFGHJKLMNPRST")}. {rng.choice(SURNAMES)}'
+        batch.append((title, author))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO book (title, author) VALUES (?, ?)", batch)
+            batch.clear()
+    conn.executemany("INSERT INTO book (title, author) VALUES (?, ?)", batch)
+    conn.commit()
+
+    started = time.perf_counter()
+    for statement in BOOK_FTS_DDL:
+        conn.execute(statement)
+    conn.commit()
+    return conn, time.perf_counter() - started
+
+
+def time_query(conn, sql, params, repeat):
+    where, select = sql
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(f"SELECT count(*) {where}", params).fetchone()
+        conn.execute(select.format(where), params).fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def bench_search(sizes, terms, repeat):
+    print(f"{'rows':>9} {'term':>10} {'ILIKE ms':>10} {'FTS5 ms':>10} {'speedup':>8}")
+    for rows in sizes:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            conn, index_seconds = build_catalog(path, rows)
+            for term in terms:
+                like_ms = time_query(conn, LIKE_SQL, {'pattern': f'%{term}%'}, repeat)
+                fts_ms = time_query(conn, FTS_SQL, {'match': fts_match_expression(term)}, repeat)
+                print(f'{rows:>9} {term:>10} {like_ms:>10.2f} {fts_ms:>10.2f} {like_ms / fts_ms:>7.1f}x')
+            print(f'{rows:>9} FTS index build: {index_seconds:.2f}s')
+            conn.close()
+        finally:
+            os.unlink(path)
+
+
+def load_books(client, books, mode):
+    started = time.perf_counter()
+    if mode == 'single':
+        for book in books:
+            assert client.post('/books', json=book).status_code in (200, 201)
+    elif mode == 'bulk json':
+        assert client.post('/books/bulk', json=books).get_json()['inserted'] == len(books)
+    else:
+        body = '\n'.join(json.dumps(book) for book in books)
+        response = client.post('/books/bulk', data=body, content_type='application/x-ndjson')
+        assert response.get_json()['inserted'] == len(books)
+    return len(books) / (time.perf_counter() - started)
+
+
+def bench_bulk(rows):
+    try:
+        with app.app_context():
+            db.engine.echo = False
+            db.drop_all()
+            db.create_all()
+        client = app.test_client()
+
+        print(f"{'mode':>12} {'rows/s':>10} {'speedup':>8}")
+        baseline = None
+        for run, mode in enumerate(('single', 'bulk json', 'bulk ndjson')):
+            books = [
+                {'title': f'Book {i}', 'author': f'Author {i % 97}', 'isbn': f'{run}-{i}'}
+                for i in range(rows)
+            ]
+            rate = load_books(client, books, mode)
+            baseline = baseline or rate
+            print(f'{mode:>12} {rate:>10.0f} {rate / baseline:>7.1f}x')
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        os.unlink(BENCH_DB_PATH)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help='ILIKE vs FTS5 /books/search latency')
+    search.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    search.add_argument('--terms', nargs='+', default=['orwell', 'glacier', 'mar'])
+    search.add_argument('--repeat', type=int, default=5)
+
+    bulk = commands.add_parser('bulk', help='rows/sec loading via POST /books vs POST /books/bulk')
+    bulk.add_argument('--rows', type=int, default=5000)
+
+    args = parser.parse_args()
+    if args.command == 'search':
+        bench_search(args.sizes, args.terms, args.repeat)
+    elif args.command == 'bulk':
+        bench_bulk(args.rows)
@@ -122,6 +122,32 @@ class LibraryAPITestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(data['books']), 0)
 
+    def test_search_prefix_match(self):
+        response = self.client.get('/books/search?q=orw')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['books']), 2)
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.client.put('/book/3', data=json.dumps({'title': 'Silmarillion', 'author': 'J.R.R. Tolkien'}),
+                        content_type='application/json')
+        self.client.delete('/book/1')
+
+        self.assertEqual(len(json.loads(self.client.get('/books/search?q=Hobbit').data)['books']), 0)
+        self.assertEqual(len(json.loads(self.client.get('/books/search?q=Silmarillion').data)['books']), 1)
+        self.assertEqual(len(json.loads(self.client.get('/books/search?q=Orwell').data)['books']), 1)
+
+    def test_search_like_fallback(self):
+        app.config['BOOK_SEARCH_BACKEND'] = 'like'
+        try:
+            response = self.client.get('/books/search?q=rwell')
+            data = json.loads(response.data)
+        finally:
+            app.config['BOOK_SEARCH_BACKEND'] = 'auto'
+
+        self.assertEqual(len(data['books']), 2)
+
     def test_pagination_first_page(self):
         response = self.client.get('/books/search?page=1&per_page=2')
         data = json.loads(response.data)
@@ -138,6 +164,120 @@ class LibraryAPITestCase(unittest.TestCase):
         self.assertEqual(len(data['books']), 1)
         self.assertEqual(data['total'], 2)
 
+    def test_cursor_pagination_first_page(self):
+        response = self.client.get('/books/search?mode=cursor&limit=2')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([b['title'] for b in data['books']], ['1984', 'Animal Farm'])
+        self.assertIsNotNone(data['next_cursor'])
+        self.assertIsNone(data['prev_cursor'])
+        self.assertIsNone(data['total'])
+
+    def test_cursor_pagination_walks_all_pages(self):
+        seen = []
+        response = self.client.get('/books/search?mode=cursor&limit=1')
+        data = json.loads(response.data)
+        while True:
+            seen.extend(b['id'] for b in data['books'])
+            if not data['next_cursor']:
+                break
+            response = self.client.get(f"/books/search?cursor={data['next_cursor']}&limit=1")
+            data = json.loads(response.data)
+
+        self.assertEqual(seen, [1, 2, 3])
+
+    def test_cursor_pagination_prev_cursor(self):
+        first = json.loads(self.client.get('/books/search?mode=cursor&limit=2').data)
+        second = json.loads(self.client.get(f"/books/search?cursor={first['next_cursor']}&limit=2").data)
+        self.assertEqual([b['title'] for b in second['books']], ['The Hobbit'])
+        self.assertIsNone(second['next_cursor'])
+
+        back = json.loads(self.client.get(f"/books/search?cursor={second['prev_cursor']}&limit=2").data)
+        self.assertEqual([b['title'] for b in back['books']], ['1984', 'Animal Farm'])
+        self.assertIsNone(back['prev_cursor'])
+        self.assertEqual(back['next_cursor'], first['next_cursor'])
+
+    def test_cursor_pagination_sort_by_title_with_search(self):
+        response = self.client.get('/books/search?q=Orwell&mode=cursor&sort=title&limit=1&include_total=true')
+        data = json.loads(response.data)
+
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['books'][0]['title'], '1984')
+
+        response = self.client.get(f"/books/search?q=Orwell&cursor={data['next_cursor']}&limit=1")
+        data = json.loads(response.data)
+        self.assertEqual(data['books'][0]['title'], 'Animal Farm')
+        self.assertIsNone(data['next_cursor'])
+
+    def test_cursor_pagination_invalid_cursor(self):
+        response = self.client.get('/books/search?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_insert_in_batches(self):
+        import app as app_module
+        books = [{'title': f'Bulk {i}', 'author': 'Bulk Author', 'isbn': f'isbn-{i}'} for i in range(5)]
+        app_module.BULK_BATCH_SIZE = 2
+        try:
+            response = self.client.post('/books/bulk', data=json.dumps(books), content_type='application/json')
+        finally:
+            app_module.BULK_BATCH_SIZE = 500
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['inserted'], data['errors']), (5, []))
+        self.assertEqual(len(json.loads(self.client.get('/books').data)['books']), 8)
+        # Bulk rows go through the FTS triggers like single inserts
+        self.assertEqual(json.loads(self.client.get('/books/search?q=bulk').data)['total'], 5)
+
+    def test_bulk_conflict_skip_and_update(self):
+        rows = [
+            {'title': 'Dune', 'author': 'Herbert', 'isbn': '9780441013593'},
+            {'title': 'Dune (2nd ed.)', 'author': 'Frank Herbert', 'isbn': '9780441013593'},
+        ]
+        data = json.loads(self.client.post('/books/bulk', data=json.dumps(rows), content_type='application/json').data)
+        self.assertEqual((data['inserted'], data['skipped']), (1, 1))
+
+        data = json.loads(self.client.post(
+            '/books/bulk?on_conflict=update', data=json.dumps(rows[1:]), content_type='application/json'
+        ).data)
+        self.assertEqual(data['updated'], 1)
+        with app.app_context():
+            self.assertEqual(Book.query.filter_by(isbn='9780441013593').one().title, 'Dune (2nd ed.)')
+
+    def test_bulk_ndjson_reports_row_errors(self):
+        body = '\n'.join([
+            json.dumps({'title': 'Good', 'author': 'A'}),
+            '{not json',
+            json.dumps({'title': 'No author'}),
+            json.dumps({'title': 'Also good', 'author': 'B'}),
+        ])
+        response = self.client.post('/books/bulk', data=body, content_type='application/x-ndjson')
+        data = json.loads(response.data)
+
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2])
+
+    def test_bulk_rejects_non_array(self):
+        response = self.client.post('/books/bulk', data=json.dumps({'title': 'x'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_existing_database_gets_isbn_column(self):
+        import app as app_module
+        with app.app_context():
+            db.drop_all()
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    'CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR(80) NOT NULL, '
+                    'author VARCHAR(40) NOT NULL, date_added DATETIME)'
+                )
+                connection.exec_driver_sql("INSERT INTO book (title, author) VALUES ('Old', 'Row')")
+        app_module._schema_ready.clear()
+
+        response = self.client.get('/books')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['books'][0]['isbn'], None)
+
     def test_full_crud_workflow(self):
         # Create a new book
         new_book = {'title': 'CRUD Test', 'author': 'CRUD Author'}
@@ -159,6 +299,25 @@ class LibraryAPITestCase(unittest.TestCase):
         verify_response = self.client.get(f'/book/{book_id}')
         self.assertEqual(verify_response.status_code, 404)
 
+    def _shared_block(self, path, marker, end_marker):
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        start = source.index(marker)
+        return source[start:source.index(end_marker, start)]
+
+    def test_shared_block_copies_are_identical(self):
+        # Week4 and the connexion app carry their own copy of the search/bulk helpers
+        root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        week8 = os.path.join(root, 'Week 8', 'app.py')
+        week4 = os.path.join(root, 'Week4', 'app.py')
+        connexion_app = os.path.join(root, 'Week 7', 'preparation', 'generated-library-api', 'library_api', 'database.py')
+        for marker, end_marker, copies in (
+            ('# --- Book search (FTS5)', '# --- end book search', (week4, connexion_app)),
+            ('# --- Book bulk upsert', '# --- end book bulk upsert', (connexion_app,)),
+        ):
+            reference = self._shared_block(week8, marker, end_marker)
+            for path in copies:
+                self.assertEqual(self._shared_block(path, marker, end_marker), reference, path)
 
 if __name__ == '__main__':
     print("="*70)
@@ -0,0 +1,231 @@
+"""
+Load tests for the Book CRUD service, run in-process against the ASGI app.
+
+    python benchmark.py pool --requests 2000 --rows 1000
+    python benchmark.py concurrency --clients 1 50 500 --rows 1000
+    python benchmark.py export --rows 10000 100000
+    python benchmark.py bulk --rows 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+import crud
+import database
+import main
+from main import app
+
+
+def legacy_get_db():
+    """What get_db() did before pooling: a new connection per call, never closed"""
+    conn = sqlite3.connect(database.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def seed(rows):
+    conn = database.connect()
+    conn.executemany(
+        "INSERT INTO books (title, author, year) VALUES (?, ?, ?)",
+        [(f"Book {i}", f"Author {i % 97}", 1900 + i % 120) for i in range(rows)],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def run_requests(requests, concurrency, path):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = iter(range(requests))
+
+        async def worker():
+            for _ in queue:
+                response = await client.get(path)
+                assert response.status_code == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - started)
+
+
+def bench_pool(requests, rows, concurrency):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database.DATABASE_PATH = os.path.join(tmpdir, "books.db")
+        database.init_db()
+        seed(rows)
+
+        results = {}
+        for mode, get_db in (("before", legacy_get_db), ("after", database.get_db)):
+            crud.get_db = get_db
+            for path in ("/books", "/books/1"):
+                results[mode, path] = asyncio.run(run_requests(requests, concurrency, path))
+        crud.get_db = database.get_db
+        database.close_all()
+
+    print(f"{'path':>10} {'before req/s':>13} {'after req/s':>12} {'speedup':>8}")
+    for path in ("/books", "/books/1"):
+        before, after = results["before", path], results["after", path]
+        print(f"{path:>10} {before:>13.1f} {after:>12.1f} {after / before:>7.2f}x")
+
+
+async def blocking_run_db(fn, *args, **kwargs):
+    """What the handlers did before the DB pool: call sqlite on the event loop"""
+    return fn(*args, **kwargs)
+
+
+async def measure_latencies(clients, per_client, path):
+    """Latencies of `path` under load, plus of a probe on "/" (no DB work) running alongside.
+
+    The probe shows whether sqlite calls stall the event loop for everyone else:
+    when they do, it gets starved and completes far fewer requests.
+    """
+    transport = httpx.ASGITransport(app=app)
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits) as client:
+        latencies, probe_latencies = [], []
+        running = True
+
+        async def worker():
+            for _ in range(per_client):
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200
+
+        async def probe():
+            while running:
+                started = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.001)
+
+        probe_task = asyncio.create_task(probe())
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        running = False
+        await probe_task
+        return latencies, probe_latencies
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1] * 1000 if len(samples) > 1 else samples[0] * 1000
+
+
+def bench_concurrency(clients_list, per_client, rows):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database.DATABASE_PATH = os.path.join(tmpdir, "books.db")
+        database.init_db()
+        seed(rows)
+
+        print(f"{'clients':>8} {'mode':>9} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'probe p50':>10} {'probe p99':>10} {'probes':>7}")
+        for clients in clients_list:
+            for mode, run_db in (("blocking", blocking_run_db), ("pooled", database.run_db)):
+                main.run_db = run_db
+                started = time.perf_counter()
+                latencies, probe = asyncio.run(measure_latencies(clients, per_client, "/books"))
+                rate = len(latencies) / (time.perf_counter() - started)
+                print(
+                    f"{clients:>8} {mode:>9} {percentile(latencies, 50):>9.2f} "
+                    f"{percentile(latencies, 99):>9.2f} {rate:>9.1f} "
+                    f"{percentile(probe, 50):>10.2f} {percentile(probe, 99):>10.2f} {len(probe):>7}"
+                )
+        main.run_db = database.run_db
+        database.close_all()
+
+
+async def download(path):
+    """Fetch `path` the way a client saving to disk would, without holding the body"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        size = 0
+        async with client.stream("GET", path, headers={"Accept-Encoding": "identity"}) as response:
+            assert response.status_code == 200
+            async for chunk in response.aiter_raw():
+                size += len(chunk)
+        return size
+
+
+def bench_export(rows_list):
+    print(f"{'rows':>9} {'path':>14} {'seconds':>8} {'MB sent':>8} {'peak MB':>8}")
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database.DATABASE_PATH = os.path.join(tmpdir, "books.db")
+            database.init_db()
+            seed(rows)
+            for path in ("/books", "/books/export"):
+                tracemalloc.start()
+                started = time.perf_counter()
+                size = asyncio.run(download(path))
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{rows:>9} {path:>14} {elapsed:>8.2f} {size / 1e6:>8.1f} {peak / 1e6:>8.1f}")
+            database.close_all()
+
+
+async def load_books(books, mode):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        if mode == "single":
+            for book in books:
+                assert (await client.post("/books", json=book)).status_code == 201
+        elif mode == "bulk json":
+            assert (await client.post("/books/bulk", json=books)).json()["inserted"] == len(books)
+        else:
+            body = "\n".join(json.dumps(book) for book in books)
+            headers = {"Content-Type": "application/x-ndjson"}
+            assert (await client.post("/books/bulk", content=body, headers=headers)).json()["inserted"] == len(books)
+        return len(books) / (time.perf_counter() - started)
+
+
+def bench_bulk(rows):
+    books = [{"title": f"Book {i}", "author": f"Author {i % 97}", "year": 2000, "isbn": f"isbn-{i}"} for i in range(rows)]
+    print(f"{'mode':>12} {'rows/s':>10} {'speedup':>8}")
+    baseline = None
+    for mode in ("single", "bulk json", "bulk ndjson"):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database.DATABASE_PATH = os.path.join(tmpdir, "books.db")
+            database.init_db()
+            rate = asyncio.run(load_books(books, mode))
+            database.close_all()
+        baseline = baseline or rate
+        print(f"{mode:>12} {rate:>10.0f} {rate / baseline:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pool = commands.add_parser("pool", help="requests/sec with a connection per call vs pooled WAL connections")
+    pool.add_argument("--requests", type=int, default=2000)
+    pool.add_argument("--rows", type=int, default=1000)
+    pool.add_argument("--concurrency", type=int, default=10)
+
+    concurrency = commands.add_parser("concurrency", help="p50/p99 latency of /books under concurrent clients")
+    concurrency.add_argument("--clients", type=int, nargs="+", default=[1, 50, 500])
+    concurrency.add_argument("--per-client", type=int, default=10)
+    concurrency.add_argument("--rows", type=int, default=1000)
+
+    export = commands.add_parser("export", help="peak memory of /books vs the streaming /books/export")
+    export.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+
+    bulk = commands.add_parser("bulk", help="rows/sec loading via POST /books vs POST /books/bulk")
+    bulk.add_argument("--rows", type=int, default=5000)
+
+    args = parser.parse_args()
+    if args.command == "pool":
+        bench_pool(args.requests, args.rows, args.concurrency)
+    elif args.command == "concurrency":
+        bench_concurrency(args.clients, args.per_client, args.rows)
+    elif args.command == "export":
+        bench_export(args.rows)
+    elif args.command == "bulk":
+        bench_bulk(args.rows)
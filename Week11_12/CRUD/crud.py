@@ -1,3 +1,5 @@
+import sqlite3
+
 from database import get_db
 
 def get_books():
@@ -5,6 +7,12 @@ def get_books():
     cursor = db.execute("SELECT * FROM books ORDER BY id")
     return [dict(row) for row in cursor.fetchall()]
 
+def get_books_after(after_id: int, limit: int):
+    """One keyset chunk of the catalog: books with id > after_id, in id order"""
+    db = get_db()
+    cursor = db.execute("SELECT * FROM books WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
 def get_book(book_id: int):
     db = get_db()
     cursor = db.execute("SELECT * FROM books WHERE id = ?", (book_id,))
@@ -14,8 +22,8 @@ def get_book(book_id: int):
 def create_book(book_data: dict):
     db = get_db()
     cursor = db.execute(
-        "INSERT INTO books (title, author, year) VALUES (?, ?, ?)",
-        (book_data["title"], book_data["author"], book_data.get("year"))
+        "INSERT INTO books (title, author, year, isbn) VALUES (?, ?, ?, ?)",
+        (book_data["title"], book_data["author"], book_data.get("year"), book_data.get("isbn"))
     )
     db.commit()
     book_data["id"] = cursor.lastrowid
@@ -23,17 +31,125 @@ def create_book(book_data: dict):
 
 def update_book(book_id: int, book_data: dict):
     db = get_db()
-    db.execute(
-        "UPDATE books SET title = ?, author = ?, year = ? WHERE id = ?",
-        (book_data["title"], book_data["author"], book_data.get("year"), book_id)
+    cursor = db.execute(
+        "UPDATE books SET title = ?, author = ?, year = ?, isbn = ? WHERE id = ?",
+        (book_data["title"], book_data["author"], book_data.get("year"), book_data.get("isbn"), book_id)
     )
     db.commit()
+    if cursor.rowcount == 0:
+        return None
     book_data["id"] = book_id
     return book_data
 
 
 def delete_book(book_id: int):
     db = get_db()
-    db.execute("DELETE FROM books WHERE id = ?", (book_id,))
+    cursor = db.execute("DELETE FROM books WHERE id = ?", (book_id,))
     db.commit()
-    return True
\ No newline at end of file
+    return cursor.rowcount > 0
+
+BULK_INSERT_SQL = {
+    "skip": "INSERT INTO books (title, author, year, isbn) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (isbn) DO NOTHING",
+    "update": "INSERT INTO books (title, author, year, isbn) VALUES (?, ?, ?, ?) "
+              "ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, author = excluded.author, year = excluded.year",
+}
+
+def bulk_upsert_books(rows: list, on_conflict: str = "skip"):
+    """Write one batch of validated (index, book_data) rows in a single transaction.
+
+    Rows whose isbn already exists (in the table or earlier in the batch) are
+    skipped or updated depending on on_conflict. Returns (counts, errors).
+    """
+    db = get_db()
+    sql = BULK_INSERT_SQL[on_conflict]
+    isbns = list({data["isbn"] for _, data in rows if data.get("isbn")})
+    seen = set()
+    if isbns:
+        placeholders = ", ".join("?" * len(isbns))
+        cursor = db.execute(f"SELECT isbn FROM books WHERE isbn IN ({placeholders})", isbns)
+        seen = {row["isbn"] for row in cursor.fetchall()}
+
+    params = [(data["title"], data["author"], data.get("year"), data.get("isbn")) for _, data in rows]
+    errors = []
+    try:
+        with db:
+            db.executemany(sql, params)
+    except sqlite3.Error:
+        # Something in the batch is rejected by the database: redo it row by row
+        # so only the offending rows are reported and everything else is kept
+        errors, written = [], []
+        with db:
+            for (index, data), row_params in zip(rows, params):
+                try:
+                    db.execute(sql, row_params)
+                    written.append((index, data))
+                except sqlite3.Error as exc:
+                    errors.append({"index": index, "error": str(exc)})
+        rows = written
+
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    for _, data in rows:
+        isbn = data.get("isbn")
+        if isbn and isbn in seen:
+            counts["updated" if on_conflict == "update" else "skipped"] += 1
+        else:
+            counts["inserted"] += 1
+            if isbn:
+                seen.add(isbn)
+    return counts, errors
+
+class ChangesExpired(Exception):
+    """The requested revision is older than the retained change log"""
+
+    def __init__(self, revision):
+        super().__init__(revision)
+        self.revision = revision
+
+def get_changes(since: int, limit: int):
+    """Changes with rev > since, one entry per book (its latest change), in rev order.
+
+    Returns (changes, revision, has_more); revision is what the client passes as
+    `since` next time. Raises ChangesExpired if rows after `since` were trimmed.
+    """
+    db = get_db()
+    # One read transaction so the log and the joined book rows agree
+    db.execute("BEGIN")
+    try:
+        oldest, newest = db.execute("SELECT MIN(rev), MAX(rev) FROM book_changes").fetchone()
+        current = db.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'book_changes'"
+        ).fetchone()
+        current = current["seq"] if current else 0
+        if since > current:
+            raise ValueError("since is ahead of the change log")
+        if since < current and (oldest is None or since < oldest - 1):
+            raise ChangesExpired(current)
+
+        cursor = db.execute(
+            """
+            SELECT c.rev, c.book_id, c.op, b.title, b.author, b.year, b.isbn
+            FROM book_changes c LEFT JOIN books b ON b.id = c.book_id
+            WHERE c.rev IN (
+                SELECT MAX(rev) FROM book_changes WHERE rev > ? GROUP BY book_id
+            )
+            ORDER BY c.rev
+            LIMIT ?
+            """,
+            (since, limit + 1),
+        )
+        rows = cursor.fetchall()
+    finally:
+        db.execute("COMMIT")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = []
+    for row in rows:
+        book = None
+        if row["op"] != "delete":
+            book = {"id": row["book_id"], "title": row["title"], "author": row["author"],
+                    "year": row["year"], "isbn": row["isbn"]}
+        changes.append({"rev": row["rev"], "op": row["op"], "id": row["book_id"], "book": book})
+    revision = rows[-1]["rev"] if has_more else current
+    return changes, revision, has_more
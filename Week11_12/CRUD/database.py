@@ -1,24 +1,119 @@
+import asyncio
 import sqlite3
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 DATABASE_PATH = "books.db"
+DB_WORKERS = int(os.environ.get("DB_WORKERS", 4))
 
-def get_db():
-    conn = sqlite3.connect(DATABASE_PATH)
+# One connection per thread, reused across requests instead of sqlite3.connect per call
+_local = threading.local()
+_connections = set()
+_connections_lock = threading.Lock()
+
+def connect():
+    conn = sqlite3.connect(DATABASE_PATH, cached_statements=256, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL: readers don't block the writer; NORMAL is safe with WAL and avoids an fsync per commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def get_db():
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn not in _connections:
+        conn = connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.add(conn)
     return conn
 
+def close_db():
+    """Close the calling thread's connection"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        with _connections_lock:
+            _connections.discard(conn)
+        conn.close()
+
+def close_all():
+    """Close every pooled connection (on shutdown)"""
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        conn.close()
+    _local.conn = None
+
+# Dedicated threads for sqlite work so queries never block the event loop.
+# Each worker thread keeps its own pooled connection (get_db is thread-local).
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="sqlite")
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking crud function on the DB pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(fn, *args, **kwargs))
+
+def ensure_isbn_column(conn):
+    """Databases created before bulk upsert have no isbn column yet"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(books)")}
+    if "isbn" not in columns:
+        conn.execute("ALTER TABLE books ADD COLUMN isbn TEXT")
+    # Unique so bulk upserts can use ON CONFLICT(isbn); NULL isbns never conflict
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_books_isbn ON books (isbn)")
+    conn.commit()
+
+# How many change-log rows /books/changes keeps; clients further behind get 410
+CHANGE_LOG_RETENTION = int(os.environ.get("CHANGE_LOG_RETENTION", 10000))
+
+def ensure_change_log(conn):
+    """Append-only book_changes table, filled by triggers so every write path is covered"""
+    is_new = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_changes'"
+    ).fetchone() is None
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS book_changes (
+            rev INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS books_log_insert AFTER INSERT ON books BEGIN
+            INSERT INTO book_changes (book_id, op) VALUES (new.id, 'insert');
+        END;
+        CREATE TRIGGER IF NOT EXISTS books_log_update AFTER UPDATE ON books BEGIN
+            INSERT INTO book_changes (book_id, op) VALUES (new.id, 'update');
+        END;
+        CREATE TRIGGER IF NOT EXISTS books_log_delete AFTER DELETE ON books BEGIN
+            INSERT INTO book_changes (book_id, op) VALUES (old.id, 'delete');
+        END;
+        DROP TRIGGER IF EXISTS book_changes_trim;
+        CREATE TRIGGER book_changes_trim AFTER INSERT ON book_changes BEGIN
+            DELETE FROM book_changes WHERE rev <= new.rev - {CHANGE_LOG_RETENTION:d};
+        END;
+    """)
+    if is_new:
+        # Rows that predate the log: record them as inserts so since=0 sees the whole catalog
+        conn.execute("INSERT INTO book_changes (book_id, op) SELECT id, 'insert' FROM books ORDER BY id")
+
 def init_db():
-    if not os.path.exists(DATABASE_PATH):
-        conn = get_db()
+    is_new = not os.path.exists(DATABASE_PATH)
+    conn = connect()
+    if is_new:
         conn.execute("""
             CREATE TABLE books (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 title TEXT NOT NULL,
                 author TEXT NOT NULL,
-                year INTEGER
+                year INTEGER,
+                isbn TEXT
             )
         """)
+    ensure_isbn_column(conn)
+    ensure_change_log(conn)
+    if is_new:
         # Sample data
         conn.executemany(
             "INSERT INTO books (title, author, year) VALUES (?, ?, ?)",
@@ -28,5 +123,5 @@ def init_db():
                 ("Clean Code", "Robert C. Martin", 2008),
             ]
         )
-        conn.commit()
-        conn.close()
\ No newline at end of file
+    conn.commit()
+    conn.close()
@@ -1,8 +1,13 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import csv
+import io
+import json
+import zlib
 import crud
-from database import init_db
+from database import init_db, close_all, run_db
 from models import Book
+from pydantic import ValidationError
 
 app = FastAPI(
     title="Book Library CRUD Demo",
@@ -13,7 +18,11 @@ app = FastAPI(
 # Initialize DB on first start
 @app.on_event("startup")
 async def startup():
-    init_db()
+    await run_db(init_db)
+
+@app.on_event("shutdown")
+async def shutdown():
+    close_all()
 
 @app.get("/")
 async def root():
@@ -22,12 +31,94 @@ async def root():
 # GET all books
 @app.get("/books", response_model=list[Book])
 async def read_books():
-    return crud.get_books()
+    return await run_db(crud.get_books)
+
+# Streaming export: rows are read EXPORT_CHUNK_SIZE at a time, so memory
+# stays flat regardless of how many books there are
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_COLUMNS = ("id", "title", "author", "year", "isbn")
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def encode_ndjson(rows):
+    return "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+
+def encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+async def export_chunks(export_format: str, after_id: int, use_gzip: bool):
+    compressor = zlib.compressobj(wbits=31) if use_gzip else None  # wbits=31: gzip container
+
+    def emit(text):
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    encode = encode_csv if export_format == "csv" else encode_ndjson
+    if export_format == "csv":
+        yield emit(",".join(EXPORT_COLUMNS) + "\r\n")
+
+    last_id = after_id
+    while True:
+        rows = await run_db(crud.get_books_after, last_id, EXPORT_CHUNK_SIZE)
+        if rows:
+            chunk = emit(encode(rows))
+            if chunk:
+                yield chunk
+            last_id = rows[-1]["id"]
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            break
+
+    if compressor:
+        yield compressor.flush()
+
+# GET full catalog as a stream
+@app.get("/books/export")
+async def export_books(
+    request: Request,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    after_id: int = Query(0, ge=0, description="Resume after the last id already received"),
+):
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {
+        "Content-Disposition": f'attachment; filename="books.{export_format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_chunks(export_format, after_id, use_gzip),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers=headers,
+    )
+
+# GET changes since a revision, for clients that mirror the catalog
+@app.get("/books/changes")
+async def read_changes(
+    since: int = Query(0, ge=0, description="The revision returned by the previous call"),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """Inserts, updates and tombstones since `since`, one entry per book.
+
+    410 means the client fell behind the retained log: it should keep the
+    `revision` from the error, re-download /books (or /books/export) and then
+    continue from that revision.
+    """
+    try:
+        changes, revision, has_more = await run_db(crud.get_changes, since, limit)
+    except crud.ChangesExpired as exc:
+        return JSONResponse(
+            status_code=410,
+            content={"detail": "Change log no longer covers this revision", "revision": exc.revision},
+        )
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    return {"revision": revision, "has_more": has_more, "changes": changes}
 
 # GET one book
 @app.get("/books/{book_id}", response_model=Book)
 async def read_book(book_id: int):
-    book = crud.get_book(book_id)
+    book = await run_db(crud.get_book, book_id)
     if not book:
         raise HTTPException(404, "Book not found")
     return book
@@ -35,19 +126,88 @@ async def read_book(book_id: int):
 # POST create book
 @app.post("/books", response_model=Book, status_code=201)
 async def create_new_book(book: Book):
-    return crud.create_book(book.dict())
+    return await run_db(crud.create_book, book.dict())
+
+# Bulk load: rows are validated as they arrive and written BULK_BATCH_SIZE
+# at a time, one executemany + commit per batch instead of one per row
+BULK_BATCH_SIZE = 500
+
+async def iter_ndjson(request: Request):
+    """Yield decoded NDJSON lines (or the exception for a bad line) as the body streams in"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield parse_json_line(line)
+    if buffer.strip():
+        yield parse_json_line(buffer)
+
+def parse_json_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        return exc
+
+async def iter_json_array(request: Request):
+    try:
+        rows = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Body must be a JSON array or NDJSON")
+    if not isinstance(rows, list):
+        raise HTTPException(400, "Body must be a JSON array or NDJSON")
+    for row in rows:
+        yield row
+
+# POST many books
+@app.post("/books/bulk")
+async def bulk_create_books(
+    request: Request,
+    on_conflict: str = Query("skip", pattern="^(skip|update)$", description="What to do when the isbn already exists"),
+):
+    content_type = request.headers.get("content-type", "")
+    rows = iter_ndjson(request) if "ndjson" in content_type else iter_json_array(request)
+    result = {"inserted": 0, "updated": 0, "skipped": 0, "errors": []}
+
+    async def flush(batch):
+        counts, errors = await run_db(crud.bulk_upsert_books, batch, on_conflict)
+        for key, value in counts.items():
+            result[key] += value
+        result["errors"].extend(errors)
+
+    batch, index = [], 0
+    async for row in rows:
+        if isinstance(row, Exception):
+            result["errors"].append({"index": index, "error": f"Invalid JSON: {row}"})
+        else:
+            try:
+                book = Book.model_validate(row)
+            except ValidationError as exc:
+                result["errors"].append({"index": index, "error": exc.errors(include_url=False, include_context=False)})
+            else:
+                batch.append((index, book.model_dump(exclude={"id"})))
+                if len(batch) >= BULK_BATCH_SIZE:
+                    await flush(batch)
+                    batch = []
+        index += 1
+    if batch:
+        await flush(batch)
+
+    result["errors"].sort(key=lambda error: error["index"])
+    return result
 
 # PUT update book
 @app.put("/books/{book_id}", response_model=Book)
 async def update_existing_book(book_id: int, book: Book):
-    if not crud.get_book(book_id):
+    updated = await run_db(crud.update_book, book_id, book.dict())
+    if not updated:
         raise HTTPException(404, "Book not found")
-    return crud.update_book(book_id, book.dict())
+    return updated
 
 # DELETE book
 @app.delete("/books/{book_id}")
 async def delete_existing_book(book_id: int):
-    if not crud.get_book(book_id):
+    if not await run_db(crud.delete_book, book_id):
         raise HTTPException(404, "Book not found")
-    crud.delete_book(book_id)
     return {"detail": "Book deleted"}
\ No newline at end of file
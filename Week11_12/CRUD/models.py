@@ -4,4 +4,5 @@ class Book(BaseModel):
     id: int | None = None
     title: str
     author: str
-    year: int | None = None
\ No newline at end of file
+    year: int | None = None
+    isbn: str | None = None
@@ -0,0 +1,229 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import httpx
+from fastapi.testclient import TestClient
+
+import database
+import main
+from main import app
+
+
+class BookCRUDTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Fresh database file per test
+        self.tmpdir = tempfile.TemporaryDirectory()
+        database.DATABASE_PATH = os.path.join(self.tmpdir.name, 'books.db')
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        database.close_all()
+        self.tmpdir.cleanup()
+
+    def test_get_all_books(self):
+        response = self.client.get('/books')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_create_and_get_book(self):
+        response = self.client.post('/books', json={'title': 'Dune', 'author': 'Frank Herbert', 'year': 1965})
+        self.assertEqual(response.status_code, 201)
+        book_id = response.json()['id']
+
+        response = self.client.get(f'/books/{book_id}')
+        self.assertEqual(response.json()['title'], 'Dune')
+
+    def test_update_book(self):
+        response = self.client.put('/books/1', json={'title': 'The Hobbit', 'author': 'Tolkien', 'year': 1937})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/books/1').json()['author'], 'Tolkien')
+
+    def test_update_missing_book(self):
+        response = self.client.put('/books/999', json={'title': 'X', 'author': 'Y'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_book(self):
+        self.assertEqual(self.client.delete('/books/1').status_code, 200)
+        self.assertEqual(self.client.get('/books/1').status_code, 404)
+        self.assertEqual(self.client.delete('/books/1').status_code, 404)
+
+    def test_connection_reused_per_thread(self):
+        conn = database.get_db()
+
+        self.assertIs(database.get_db(), conn)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+
+    def test_close_all_reconnects(self):
+        conn = database.get_db()
+        database.close_all()
+
+        self.assertIsNot(database.get_db(), conn)
+        self.assertEqual(self.client.get('/books').status_code, 200)
+
+    def test_db_work_runs_off_event_loop(self):
+        thread_name = asyncio.run(database.run_db(lambda: threading.current_thread().name))
+
+        self.assertTrue(thread_name.startswith('sqlite'))
+
+    def test_concurrent_requests(self):
+        async def fetch_many():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await asyncio.gather(*(client.get('/books') for _ in range(20)))
+
+        responses = asyncio.run(fetch_many())
+        self.assertTrue(all(r.status_code == 200 and len(r.json()) == 3 for r in responses))
+
+    def test_export_ndjson(self):
+        response = self.client.get('/books/export', headers={'Accept-Encoding': 'identity'})
+        rows = [json.loads(line) for line in response.text.splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/x-ndjson')
+        self.assertEqual([row['id'] for row in rows], [1, 2, 3])
+        self.assertEqual(rows[0]['title'], 'The Hobbit')
+
+    def test_export_csv(self):
+        response = self.client.get('/books/export?format=csv', headers={'Accept-Encoding': 'identity'})
+        rows = list(csv.reader(io.StringIO(response.text)))
+
+        self.assertEqual(rows[0], ['id', 'title', 'author', 'year', 'isbn'])
+        self.assertEqual(rows[2], ['2', '1984', 'George Orwell', '1949', ''])
+        self.assertEqual(len(rows), 4)
+
+    def test_export_in_chunks_and_resume(self):
+        for i in range(7):
+            self.client.post('/books', json={'title': f'Book {i}', 'author': 'A'})
+        main.EXPORT_CHUNK_SIZE = 2
+        try:
+            response = self.client.get('/books/export?after_id=4', headers={'Accept-Encoding': 'identity'})
+        finally:
+            main.EXPORT_CHUNK_SIZE = 1000
+        ids = [json.loads(line)['id'] for line in response.text.splitlines()]
+
+        self.assertEqual(ids, [5, 6, 7, 8, 9, 10])
+
+    def test_export_gzip(self):
+        response = self.client.get('/books/export', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertEqual(len(response.text.splitlines()), 3)
+
+    def test_export_rejects_unknown_format(self):
+        self.assertEqual(self.client.get('/books/export?format=xml').status_code, 422)
+
+    def test_bulk_insert_json_array(self):
+        books = [{'title': f'Book {i}', 'author': 'A', 'isbn': f'isbn-{i}'} for i in range(5)]
+        main.BULK_BATCH_SIZE = 2
+        try:
+            response = self.client.post('/books/bulk', json=books)
+        finally:
+            main.BULK_BATCH_SIZE = 500
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'inserted': 5, 'updated': 0, 'skipped': 0, 'errors': []})
+        self.assertEqual(len(self.client.get('/books').json()), 8)
+
+    def test_bulk_conflict_skip_and_update(self):
+        self.client.post('/books/bulk', json=[{'title': 'Dune', 'author': 'Herbert', 'isbn': '978-0441013593'}])
+        rows = [
+            {'title': 'Dune (2nd ed.)', 'author': 'Frank Herbert', 'isbn': '978-0441013593'},
+            {'title': 'Emma', 'author': 'Austen', 'isbn': '978-0141439587'},
+        ]
+
+        skipped = self.client.post('/books/bulk?on_conflict=skip', json=rows).json()
+        self.assertEqual((skipped['inserted'], skipped['skipped']), (1, 1))
+        self.assertEqual(self.client.get('/books/4').json()['title'], 'Dune')
+
+        updated = self.client.post('/books/bulk?on_conflict=update', json=rows).json()
+        self.assertEqual((updated['inserted'], updated['updated']), (0, 2))
+        self.assertEqual(self.client.get('/books/4').json()['title'], 'Dune (2nd ed.)')
+        self.assertEqual(len(self.client.get('/books').json()), 5)
+
+    def test_bulk_ndjson_reports_row_errors(self):
+        body = '\n'.join([
+            json.dumps({'title': 'Good', 'author': 'A'}),
+            '{not json',
+            json.dumps({'title': 'Missing author'}),
+            json.dumps({'title': 'Also good', 'author': 'B', 'year': 2001}),
+        ])
+        response = self.client.post('/books/bulk', content=body, headers={'Content-Type': 'application/x-ndjson'})
+        result = response.json()
+
+        self.assertEqual(result['inserted'], 2)
+        self.assertEqual([error['index'] for error in result['errors']], [1, 2])
+
+    def test_bulk_rejects_non_array(self):
+        self.assertEqual(self.client.post('/books/bulk', json={'title': 'X'}).status_code, 400)
+        self.assertEqual(self.client.post('/books/bulk?on_conflict=replace', json=[]).status_code, 422)
+
+    def test_changes_feed(self):
+        start = self.client.get('/books/changes').json()
+        self.assertEqual(start['revision'], 3)  # the three sample books
+        self.assertEqual([change['op'] for change in start['changes']], ['insert'] * 3)
+
+        self.client.put('/books/1', json={'title': 'The Hobbit', 'author': 'Tolkien'})
+        self.client.put('/books/1', json={'title': 'The Hobbit', 'author': 'J. R. R. Tolkien'})
+        self.client.delete('/books/2')
+        self.client.post('/books/bulk', json=[{'title': 'Dune', 'author': 'Herbert', 'isbn': 'x'}])
+
+        feed = self.client.get(f"/books/changes?since={start['revision']}").json()
+        changes = {change['id']: change for change in feed['changes']}
+        self.assertEqual(feed['revision'], 7)
+        self.assertEqual(len(feed['changes']), 3)  # two updates of book 1 are compacted
+        self.assertEqual(changes[1]['book']['author'], 'J. R. R. Tolkien')
+        self.assertEqual((changes[2]['op'], changes[2]['book']), ('delete', None))
+        self.assertEqual(changes[4]['op'], 'insert')
+
+        self.assertEqual(self.client.get(f"/books/changes?since={feed['revision']}").json()['changes'], [])
+
+    def test_changes_paging(self):
+        first = self.client.get('/books/changes?limit=2').json()
+        rest = self.client.get(f"/books/changes?since={first['revision']}&limit=2").json()
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([c['id'] for c in first['changes'] + rest['changes']], [1, 2, 3])
+
+    def test_changes_gone_when_log_trimmed(self):
+        conn = database.get_db()
+        conn.execute('DELETE FROM book_changes WHERE rev <= 2')
+        conn.commit()
+
+        response = self.client.get('/books/changes?since=0')
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['revision'], 3)
+        self.assertEqual(self.client.get('/books/changes?since=2').status_code, 200)
+        self.assertEqual(self.client.get('/books/changes?since=99').status_code, 400)
+
+    def test_changes_backfilled_for_existing_database(self):
+        # A books.db from before the change log (and before isbn)
+        self.client.__exit__(None, None, None)
+        database.close_all()
+        os.remove(database.DATABASE_PATH)
+        conn = sqlite3.connect(database.DATABASE_PATH)
+        conn.execute('CREATE TABLE books (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, author TEXT NOT NULL, year INTEGER)')
+        conn.executemany('INSERT INTO books (title, author) VALUES (?, ?)', [('A', 'x'), ('B', 'y')])
+        conn.commit()
+        conn.close()
+        self.client.__enter__()
+
+        feed = self.client.get('/books/changes?since=0').json()
+        self.assertEqual([(c['op'], c['book']['title']) for c in feed['changes']], [('insert', 'A'), ('insert', 'B')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+"""
+Broadcast latency of the board with many connected clients, in-process.
+
+Clients are fake sockets: most receive instantly, a few are slow (each send
+sleeps), which is what stalls a serial broadcast.
+
+    python benchmark.py broadcast --clients 1000 5000 10000 --slow 5
+    python benchmark.py store --books 1000 10000 100000 --connects 1000
+    python benchmark.py burst --windows 0 10 25 50 --rate 5000 --seconds 1
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from main import BookStore, Coalescer, ConnectionManager, LocalBackplane
+
+
+class FakeSocket:
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = {}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received[json.loads(text)["seq"]] = time.perf_counter()
+
+    async def send_json(self, message):
+        await self.send_text(json.dumps(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+class CountingSocket:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.frames += 1
+        self.bytes += len(text.encode())
+
+
+class SerialManager:
+    """What broadcast did before per-connection queues: await every send in turn"""
+
+    def __init__(self):
+        self.active_connections = []
+
+    async def connect(self, ws):
+        await ws.accept()
+        self.active_connections.append(ws)
+
+    async def broadcast(self, message):
+        for conn in self.active_connections:
+            await conn.send_json(message)
+
+
+async def measure(manager, clients, slow, delay, messages):
+    sockets = [FakeSocket(delay if i < slow else 0) for i in range(clients)]
+    for ws in sockets:
+        await manager.connect(ws)
+    fast = sockets[slow:]
+
+    sent_at, call_ms = {}, []
+    for seq in range(messages):
+        sent_at[seq] = time.perf_counter()
+        await manager.broadcast({"type": "added", "seq": seq, "book": {"id": seq, "title": "Dune", "author": "Herbert"}})
+        call_ms.append((time.perf_counter() - sent_at[seq]) * 1000)
+
+    # Wait until every fast client has every message
+    while any(len(ws.received) < messages for ws in fast):
+        await asyncio.sleep(0.001)
+    latencies = [(ws.received[seq] - sent_at[seq]) * 1000 for ws in fast for seq in range(messages)]
+
+    for conn in getattr(manager.active_connections, "values", lambda: [])():
+        conn.writer.cancel()
+    return statistics.median(call_ms), statistics.median(latencies), max(latencies)
+
+
+def bench_broadcast(clients_list, slow, delay, messages):
+    print(f"{'clients':>8} {'mode':>7} {'call ms':>9} {'fast p50 ms':>12} {'fast max ms':>12}")
+    for clients in clients_list:
+        for mode, factory in (("serial", SerialManager), ("queued", lambda: ConnectionManager(policy="coalesce"))):
+            call, p50, worst = asyncio.run(measure(factory(), clients, slow, delay, messages))
+            print(f"{clients:>8} {mode:>7} {call:>9.2f} {p50:>12.2f} {worst:>12.2f}")
+
+
+def bench_store(sizes, connects, ops):
+    print(f"{'books':>8} {'list add+del us':>16} {'store add+del us':>17} {'encode/connect ms':>18} {'cached ms':>10}")
+    for size in sizes:
+        seed = [{"id": i, "title": f"Book {i}", "author": "Author"} for i in range(1, size + 1)]
+
+        # The old list: max() over every id per add, rebuild the list per delete
+        books = [dict(book) for book in seed]
+        started = time.perf_counter()
+        for _ in range(ops):
+            new_id = max(b["id"] for b in books) + 1
+            books.append({"id": new_id, "title": "Dune", "author": "Herbert"})
+            books[:] = [b for b in books if b["id"] != new_id]
+        list_us = (time.perf_counter() - started) / ops * 1e6
+
+        store = BookStore(seed)
+        started = time.perf_counter()
+        for _ in range(ops):
+            store.delete(store.add("Dune", "Herbert")["id"])
+        store_us = (time.perf_counter() - started) / ops * 1e6
+
+        started = time.perf_counter()
+        for _ in range(connects):
+            json.dumps({"type": "init", "books": books})
+        encode_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for _ in range(connects):
+            store.snapshot_text()
+        cached_ms = (time.perf_counter() - started) * 1000
+        print(f"{size:>8} {list_us:>16.1f} {store_us:>17.1f} {encode_ms:>18.1f} {cached_ms:>10.1f}")
+
+
+async def measure_burst(window_ms, clients, rate, seconds, delete_ratio):
+    manager = ConnectionManager(max_queue=1_000_000)
+    coalescer = Coalescer(manager.broadcast, window_ms=window_ms)
+    backplane = LocalBackplane(BookStore())
+    await backplane.start(coalescer.publish)
+    sockets = [CountingSocket() for _ in range(clients)]
+    for ws in sockets:
+        await manager.connect(ws)
+
+    # Actions arrive in 1 ms ticks; every delete_ratio-th add is deleted right after
+    per_tick = max(1, rate // 1000)
+    started = time.perf_counter()
+    for tick in range(int(seconds * 1000)):
+        for i in range(per_tick):
+            await backplane.add_book("Dune", "Frank Herbert")
+            if delete_ratio and (tick * per_tick + i) % delete_ratio == 0:
+                await backplane.delete_book(backplane.store._next_id - 1)
+        await asyncio.sleep(0.001)
+    await coalescer.flush()
+    while any(not conn.queue.empty() for conn in manager.active_connections.values()):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    for conn in manager.active_connections.values():
+        conn.writer.cancel()
+    frames = sum(ws.frames for ws in sockets)
+    sent = sum(ws.bytes for ws in sockets)
+    return coalescer.stats["events"], frames / elapsed, sent / elapsed, frames, sent, elapsed
+
+
+def bench_burst(windows, clients, rate, seconds, delete_ratio):
+    print(f"{'window ms':>9} {'events':>7} {'frames':>8} {'frames/s':>10} {'MB/s':>7} {'MB sent':>8} {'bytes saved':>12} {'secs':>6}")
+    baseline = None
+    for window in windows:
+        events, fps, bps, frames, sent, elapsed = asyncio.run(measure_burst(window, clients, rate, seconds, delete_ratio))
+        baseline = sent if baseline is None else baseline
+        saved = 1 - sent / baseline
+        print(f"{window:>9g} {events:>7} {frames:>8} {fps:>10.0f} {bps / 1e6:>7.2f} {sent / 1e6:>8.2f} {saved:>11.0%} {elapsed:>6.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    broadcast = commands.add_parser("broadcast", help="serial awaits vs per-connection queues")
+    broadcast.add_argument("--clients", type=int, nargs="+", default=[1000, 5000, 10000])
+    broadcast.add_argument("--slow", type=int, default=5, help="how many clients are slow")
+    broadcast.add_argument("--delay", type=float, default=0.02, help="seconds per send for slow clients")
+    broadcast.add_argument("--messages", type=int, default=5)
+
+    store = commands.add_parser("store", help="list vs indexed store, per-connect encoding vs cached snapshot")
+    store.add_argument("--books", type=int, nargs="+", default=[1000, 10000, 100000])
+    store.add_argument("--connects", type=int, default=1000, help="clients connecting in one storm")
+    store.add_argument("--ops", type=int, default=200, help="add+delete pairs to time")
+
+    burst = commands.add_parser("burst", help="frames and bytes per client with and without a coalescing window")
+    burst.add_argument("--windows", type=float, nargs="+", default=[0, 10, 25, 50], help="ms; the first is the baseline")
+    burst.add_argument("--clients", type=int, default=100)
+    burst.add_argument("--rate", type=int, default=5000, help="add actions per second")
+    burst.add_argument("--seconds", type=float, default=1)
+    burst.add_argument("--delete-ratio", type=int, default=4, help="delete every Nth book right after adding it (0: never)")
+
+    args = parser.parse_args()
+    if args.command == "broadcast":
+        bench_broadcast(args.clients, args.slow, args.delay, args.messages)
+    elif args.command == "store":
+        bench_store(args.books, args.connects, args.ops)
+    elif args.command == "burst":
+        bench_burst(args.windows, args.clients, args.rate, args.seconds, args.delete_ratio)
@@ -3,46 +3,429 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from starlette.requests import Request
-from typing import List, Dict
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+import asyncio
+import logging
+import os
+import time
 import uvicorn
 import json
 
-app = FastAPI(title="RealTime Book Board")
+class BookStore:
+    """In-memory books keyed by id; dict order is insertion order, so it doubles as the list view"""
+    def __init__(self, books: Iterable[Dict] = ()):
+        self.reset(books)
+
+    def reset(self, books: Iterable[Dict]):
+        self._books: Dict[int, Dict] = {book["id"]: dict(book) for book in books}
+        self._next_id = max(self._books, default=0) + 1
+        self._snapshot: Optional[str] = None
+
+    def add(self, title: str, author: str) -> Dict:
+        book = {"id": self._next_id, "title": title, "author": author}
+        self._next_id += 1
+        self._books[book["id"]] = book
+        self._snapshot = None
+        return book
+
+    def put(self, book: Dict):
+        """Insert or replace a book whose id was assigned elsewhere (another worker)"""
+        self._books[book["id"]] = dict(book)
+        self._next_id = max(self._next_id, book["id"] + 1)
+        self._snapshot = None
+
+    def apply(self, event: Dict):
+        """Replay an "added"/"deleted" event; replaying one twice changes nothing"""
+        if event["type"] == "added":
+            self.put(event["book"])
+        elif event["type"] == "deleted":
+            self.delete(event["id"])
+
+    def delete(self, book_id: int) -> bool:
+        if self._books.pop(book_id, None) is None:
+            return False
+        self._snapshot = None
+        return True
+
+    def all(self) -> List[Dict]:
+        return list(self._books.values())
+
+    def __len__(self):
+        return len(self._books)
+
+    def snapshot_text(self) -> str:
+        """The "init" frame, encoded once per change instead of once per connecting client"""
+        if self._snapshot is None:
+            self._snapshot = json.dumps({"type": "init", "books": self.all()})
+        return self._snapshot
 
 # In-memory storage 
-books: List[Dict] = [
+books = BookStore([
     {"id": 1, "title": "The Pragmatic Programmer", "author": "David Thomas"},
     {"id": 2, "title": "Clean Architecture", "author": "Robert C. Martin"},
-]
+])
+
+# Outbound frames per client before the slow-consumer policy kicks in
+SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", 256))
+# drop: discard new frames, coalesce: replace the backlog with a fresh "init",
+# disconnect: close the socket (1013 try again later)
+SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "coalesce")
+
+RESYNC = object()  # queue marker: send the current snapshot instead of the backlog
+
+def snapshot_text() -> str:
+    return books.snapshot_text()
+
+class Connection:
+    """One client: a bounded queue of pre-encoded frames drained by its own writer task"""
+    def __init__(self, ws: WebSocket, max_queue: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.writer: asyncio.Task | None = None
+
+    async def write_loop(self, manager: "ConnectionManager"):
+        try:
+            while True:
+                text = await self.queue.get()
+                if text is RESYNC:
+                    text = manager.snapshot()
+                await self.ws.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is gone; the receive loop or the next broadcast cleans up
+            manager.disconnect(self.ws)
 
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: int = SEND_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY, snapshot=snapshot_text):
+        if policy not in ("drop", "coalesce", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.active_connections: Dict[WebSocket, Connection] = {}
+        self.max_queue = max_queue
+        self.policy = policy
+        self.snapshot = snapshot
+        self.stats = {"dropped": 0, "resynced": 0, "disconnected_slow": 0}
 
     async def connect(self, ws: WebSocket):
         await ws.accept()
-        self.active_connections.append(ws)
+        conn = Connection(ws, self.max_queue)
+        self.active_connections[ws] = conn
+        conn.writer = asyncio.create_task(conn.write_loop(self))
+        return conn
 
     def disconnect(self, ws: WebSocket):
-        self.active_connections.remove(ws)
+        conn = self.active_connections.pop(ws, None)
+        if conn is not None and conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
+    def send(self, ws: WebSocket, text: str):
+        """Queue one pre-encoded frame without waiting for the client"""
+        conn = self.active_connections.get(ws)
+        if conn is None:
+            return
+        try:
+            conn.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == "drop":
+            self.stats["dropped"] += 1
+        elif self.policy == "coalesce":
+            # Everything queued is superseded by one snapshot of the current state
+            while not conn.queue.empty():
+                conn.queue.get_nowait()
+            conn.queue.put_nowait(RESYNC)
+            self.stats["resynced"] += 1
+        else:
+            self.stats["disconnected_slow"] += 1
+            self.disconnect(ws)
+            asyncio.create_task(self._close(ws))
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        try:
+            await ws.close(code=1013)
+        except Exception:
+            pass
 
     async def broadcast(self, message: dict):
-        dead = []
-        for conn in self.active_connections:
-            try:
-                await conn.send_json(message)
-            except:
-                dead.append(conn)
-        for conn in dead:
-            self.active_connections.remove(conn)
+        """Encode once, then hand the same text to every connection's queue"""
+        text = json.dumps(message)
+        for ws in list(self.active_connections):
+            self.send(ws, text)
+        # Let writers run before the next broadcast, so a burst only backs up
+        # the queues of clients that really can't keep up
+        await asyncio.sleep(0)
+
+Handler = Callable[[Dict], Awaitable[None]]
+
+class LocalBackplane:
+    """Single process: mutations change the store and go straight to this process's clients"""
+    def __init__(self, store: BookStore):
+        self.store = store
+        self.handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    async def add_book(self, title: str, author: str):
+        await self.handler({"type": "added", "book": self.store.add(title, author)})
+
+    async def delete_book(self, book_id: int):
+        if self.store.delete(book_id):
+            await self.handler({"type": "deleted", "id": book_id})
+
+class RedisBackplane:
+    """Several workers: books live in Redis, every mutation is published on a channel.
+
+    Each worker keeps its BookStore as a replica: it loads the hash on start,
+    then applies every event it receives (its own included) before handing it
+    to its local clients, so snapshots stay in sync without a Redis round trip.
+    """
+    def __init__(self, store: BookStore, url: str = "redis://localhost:6379/0", client=None, prefix: str = "board"):
+        self.store = store
+        self.url = url
+        self.client = client
+        self.channel = f"{prefix}:events"
+        self.books_key = f"{prefix}:books"
+        self.next_id_key = f"{prefix}:next_id"
+        self.pubsub = None
+        self.reader: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        if self.client is None:
+            import redis.asyncio as redis  # only needed when WS_BACKPLANE_URL is set
+            self.client = redis.from_url(self.url)
+        # Subscribe before loading so nothing published in between is missed
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(self.channel)
+        await self._seed()
+        stored = await self.client.hgetall(self.books_key)
+        self.store.reset(sorted((json.loads(value) for value in stored.values()), key=lambda book: book["id"]))
+        self.reader = asyncio.create_task(self._read(handler))
+
+    async def _seed(self):
+        """First worker up copies its built-in books to Redis; the others find them there"""
+        seed = self.store.all()
+        if seed:
+            for book in seed:
+                await self.client.hsetnx(self.books_key, book["id"], json.dumps(book))
+            await self.client.set(self.next_id_key, max(book["id"] for book in seed), nx=True)
+
+    async def _read(self, handler: Handler):
+        async for message in self.pubsub.listen():
+            if message["type"] != "message":
+                continue
+            event = json.loads(message["data"])
+            self.store.apply(event)
+            await handler(event)
+
+    async def stop(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+
+    async def add_book(self, title: str, author: str):
+        book_id = await self.client.incr(self.next_id_key)
+        book = {"id": book_id, "title": title, "author": author}
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.books_key, book_id, json.dumps(book))
+            pipe.publish(self.channel, json.dumps({"type": "added", "book": book}))
+            await pipe.execute()
+
+    async def delete_book(self, book_id: int):
+        if await self.client.hdel(self.books_key, book_id):
+            await self.client.publish(self.channel, json.dumps({"type": "deleted", "id": book_id}))
+
+# Hold broadcasts this long and send them as one "batch" frame; 0 sends every event at once
+COALESCE_WINDOW_MS = float(os.environ.get("WS_COALESCE_MS", 0))
+
+class Coalescer:
+    """Buffers events for a short window, then hands them on as one {"type": "batch"} frame.
+
+    An "added" followed by a "deleted" of the same book inside the window
+    cancels out: clients never see either.
+    """
+    def __init__(self, send: Handler, window_ms: float = COALESCE_WINDOW_MS):
+        self.send = send
+        self.window = window_ms / 1000
+        # ("added", id) for adds so a delete finds its pair in O(1), a sequence number otherwise
+        self.pending: Dict[object, Dict] = {}
+        self.seq = 0
+        self.flusher: Optional[asyncio.Task] = None
+        self.stats = {"events": 0, "frames": 0, "cancelled": 0}
+
+    async def publish(self, event: Dict):
+        self.stats["events"] += 1
+        if self.window <= 0:
+            self.stats["frames"] += 1
+            await self.send(event)
+            return
+        if event["type"] == "deleted" and self.pending.pop(("added", event["id"]), None) is not None:
+            self.stats["cancelled"] += 2
+            return
+        if event["type"] == "added":
+            key = ("added", event["book"]["id"])
+        else:
+            self.seq += 1
+            key = self.seq
+        self.pending[key] = event
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self.flusher = None
+        await self.flush()
+
+    async def flush(self):
+        """Send whatever is pending now (also before a snapshot, so no event is sent on both sides of it)"""
+        if self.flusher is not None and self.flusher is not asyncio.current_task():
+            self.flusher.cancel()
+            self.flusher = None
+        events = list(self.pending.values())
+        self.pending.clear()
+        if not events:
+            return
+        self.stats["frames"] += 1
+        await self.send(events[0] if len(events) == 1 else {"type": "batch", "events": events})
+
+# Empty: one process; redis://host:port/db shares books and broadcasts between uvicorn workers
+BACKPLANE_URL = os.environ.get("WS_BACKPLANE_URL", "")
+
+def make_backplane(store: BookStore, url: str = BACKPLANE_URL):
+    if url:
+        return RedisBackplane(store, url)
+    return LocalBackplane(store)
+
+# Per client: mutations per second (refill rate) and how many may arrive at once
+RATE_PER_SEC = float(os.environ.get("WS_RATE_PER_SEC", 20))
+RATE_BURST = int(os.environ.get("WS_RATE_BURST", 40))
+# Longest accepted frame in characters; uvicorn's ws_max_size caps raw bytes before that
+MAX_MESSAGE_SIZE = int(os.environ.get("WS_MAX_MESSAGE_SIZE", 4096))
+# Raw frame limit: a UTF-8 character is at most 4 bytes
+MAX_FRAME_BYTES = 4 * MAX_MESSAGE_SIZE
+# Mutations from one client still waiting on the backplane
+MAX_IN_FLIGHT = int(os.environ.get("WS_MAX_IN_FLIGHT", 4))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+# Frames refused by the receive loop, by reason
+receive_stats = {"too_large": 0, "rate_limited": 0, "busy": 0, "invalid": 0, "failed": 0}
+
+logger = logging.getLogger(__name__)
+
+class FrameSizeLimit:
+    """ASGI middleware: close a websocket (1009) whose frame is over max_bytes.
+
+    uvicorn's ws_max_size only applies when __main__ passes it; this holds
+    however the app is served (uvicorn main:app, several workers, tests).
+    """
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            await self.app(scope, receive, send)
+            return
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                text, data = message.get("text"), message.get("bytes")
+                # Only encode text long enough to possibly be over the limit
+                if text is not None and len(text) * 4 > self.max_bytes:
+                    data = text.encode()
+                if data is not None and len(data) > self.max_bytes:
+                    receive_stats["too_large"] += 1
+                    await send({"type": "websocket.close", "code": 1009})
+                    return {"type": "websocket.disconnect", "code": 1009}
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def finish_action(task: asyncio.Task):
+    """Done-callback: a failed mutation (e.g. Redis went away) is logged and counted, not lost"""
+    if not task.cancelled() and task.exception() is not None:
+        receive_stats["failed"] += 1
+        logger.error("board mutation failed", exc_info=task.exception())
+
+def parse_action(data: str) -> Optional[tuple]:
+    """("add", title, author) or ("delete", id); None for anything malformed"""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("action") == "add":
+        title, author = payload.get("title"), payload.get("author")
+        if isinstance(title, str) and isinstance(author, str) and title and author:
+            return ("add", title, author)
+    elif payload.get("action") == "delete" and type(payload.get("id")) is int:
+        return ("delete", payload["id"])
+    return None
+
+async def run_action(action: tuple):
+    if action[0] == "add":
+        await backplane.add_book(action[1], action[2])
+    else:
+        await backplane.delete_book(action[1])
 
 manager = ConnectionManager()
+coalescer = Coalescer(manager.broadcast)
+backplane = make_backplane(books)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await backplane.start(coalescer.publish)
+    yield
+    await backplane.stop()
+    await coalescer.flush()
+
+app = FastAPI(title="RealTime Book Board", lifespan=lifespan)
+app.add_middleware(FrameSizeLimit, max_bytes=MAX_FRAME_BYTES)
 
 # HTML
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="templates"), name="static")
 
+@app.get("/stats")
+async def stats():
+    return {
+        "connections": len(manager.active_connections),
+        "policy": manager.policy,
+        "backplane": type(backplane).__name__,
+        "coalesce_ms": coalescer.window * 1000,
+        **manager.stats,
+        **{f"coalesce_{name}": value for name, value in coalescer.stats.items()},
+        **{f"receive_{reason}": value for reason, value in receive_stats.items()},
+    }
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -50,30 +433,41 @@ async def home(request: Request):
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    # Events still in the window are already in the snapshot: deliver them to the others first
+    await coalescer.flush()
     await manager.connect(websocket)
-    # Send current state immediately
-    await websocket.send_json({"type": "init", "books": books})
+    # Send current state immediately (through the queue, so it precedes any broadcast)
+    manager.send(websocket, manager.snapshot())
+    bucket = TokenBucket(RATE_PER_SEC, RATE_BURST)
+    in_flight: set = set()
     
     try:
         while True:
             data = await websocket.receive_text()
-            payload = json.loads(data)
-            
-            if payload["action"] == "add":
-                new_book = {
-                    "id": max(b["id"] for b in books) + 1 if books else 1,
-                    "title": payload["title"],
-                    "author": payload["author"]
-                }
-                books.append(new_book)
-                await manager.broadcast({"type": "added", "book": new_book})
-                
-            elif payload["action"] == "delete":
-                books[:] = [b for b in books if b["id"] != payload["id"]]
-                await manager.broadcast({"type": "deleted", "id": payload["id"]})
+            # Cheapest checks first: a flooding client costs a length check and a clock read
+            action = None
+            if len(data) > MAX_MESSAGE_SIZE:
+                reason = "too_large"
+            elif not bucket.take():
+                reason = "rate_limited"
+            elif len(in_flight) >= MAX_IN_FLIGHT:
+                reason = "busy"
+            else:
+                action = parse_action(data)
+                reason = "invalid" if action is None else None
+            if reason is not None:
+                receive_stats[reason] += 1
+                manager.send(websocket, json.dumps({"type": "error", "reason": reason}))
+                continue
+
+            # Run the mutation beside the loop, so a slow backplane doesn't stop us reading
+            task = asyncio.create_task(run_action(action))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            task.add_done_callback(finish_action)
                 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, ws_max_size=MAX_FRAME_BYTES)
\ No newline at end of file
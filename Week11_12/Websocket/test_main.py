@@ -0,0 +1,232 @@
+import asyncio
+import json
+import unittest
+
+from fastapi.testclient import TestClient
+
+import main
+from main import BookStore, ConnectionManager, RedisBackplane, app
+
+try:
+    import fakeredis
+except ImportError:  # only the backplane test needs it
+    fakeredis = None
+
+
+class BlockedSocket:
+    """Stands in for a client that never reads: every send waits forever"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self.release.wait()
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+class BoardTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.books = main.books.all()
+
+    def tearDown(self):
+        main.books.reset(self.books)
+
+    def test_add_and_delete_reach_every_client(self):
+        # Entered client: both sockets share one event loop, as under uvicorn
+        with TestClient(app) as client, client.websocket_connect('/ws') as first, client.websocket_connect('/ws') as second:
+            self.assertEqual(first.receive_json()['type'], 'init')
+            self.assertEqual(len(second.receive_json()['books']), 2)
+
+            first.send_text(json.dumps({'action': 'add', 'title': 'Dune', 'author': 'Frank Herbert'}))
+            added = [first.receive_json(), second.receive_json()]
+            self.assertEqual({message['book']['id'] for message in added}, {3})
+
+            second.send_text(json.dumps({'action': 'delete', 'id': 3}))
+            self.assertEqual(first.receive_json(), {'type': 'deleted', 'id': 3})
+            self.assertEqual(second.receive_json(), {'type': 'deleted', 'id': 3})
+
+    def test_abusive_frames_are_refused(self):
+        limits = main.RATE_PER_SEC, main.RATE_BURST, main.MAX_MESSAGE_SIZE
+        main.RATE_PER_SEC, main.RATE_BURST, main.MAX_MESSAGE_SIZE = 0.001, 3, 200
+        before = dict(main.receive_stats)
+        try:
+            with TestClient(app) as client, client.websocket_connect('/ws') as ws:
+                ws.receive_json()
+                ws.send_text('{"action": "add"')
+                ws.send_text(json.dumps({'action': 'add', 'title': 'x' * 300, 'author': 'y'}))
+                ws.send_text(json.dumps({'action': 'add', 'title': 'Dune', 'author': 'Frank Herbert'}))
+                ws.send_text(json.dumps({'action': 'delete', 'id': 1}))
+                ws.send_text(json.dumps({'action': 'delete', 'id': 2}))
+                received = []
+                while len(received) < 5:
+                    message = ws.receive_json()
+                    received.extend(message['events'] if message['type'] == 'batch' else [message])
+        finally:
+            main.RATE_PER_SEC, main.RATE_BURST, main.MAX_MESSAGE_SIZE = limits
+
+        errors = sorted(message['reason'] for message in received if message['type'] == 'error')
+        self.assertEqual(errors, ['invalid', 'rate_limited', 'too_large'])
+        self.assertEqual(sorted(message['type'] for message in received if message['type'] != 'error'), ['added', 'deleted'])
+        for reason in ('invalid', 'rate_limited', 'too_large'):
+            self.assertEqual(main.receive_stats[reason], before[reason] + 1)
+
+    def test_oversized_frame_closes_socket_and_failed_mutation_is_counted(self):
+        from starlette.websockets import WebSocketDisconnect
+
+        async def broken_add(title, author):
+            raise ConnectionError('backplane down')
+
+        failed = main.receive_stats['failed']
+        add_book, main.backplane.add_book = main.backplane.add_book, broken_add
+        try:
+            with TestClient(app) as client:
+                with client.websocket_connect('/ws') as ws:
+                    ws.receive_json()
+                    with self.assertLogs('main', 'ERROR'):
+                        ws.send_text(json.dumps({'action': 'add', 'title': 'Dune', 'author': 'Frank Herbert'}))
+                        ws.send_text('x' * (main.MAX_FRAME_BYTES + 1))
+                        with self.assertRaises(WebSocketDisconnect) as closed:
+                            ws.receive_json()
+        finally:
+            main.backplane.add_book = add_book
+
+        self.assertEqual(closed.exception.code, 1009)
+        self.assertEqual(main.receive_stats['failed'], failed + 1)
+
+    def test_store_ids_and_snapshot_cache(self):
+        store = main.BookStore([{'id': 1, 'title': 'A', 'author': 'a'}, {'id': 2, 'title': 'B', 'author': 'b'}])
+        snapshot = store.snapshot_text()
+        self.assertIs(store.snapshot_text(), snapshot)
+
+        store.delete(2)
+        # Ids are never reused, even after deleting the newest book
+        self.assertEqual(store.add('C', 'c')['id'], 3)
+        self.assertIsNot(store.snapshot_text(), snapshot)
+        self.assertEqual([book['id'] for book in json.loads(store.snapshot_text())['books']], [1, 3])
+        self.assertFalse(store.delete(42))
+
+    def run_slow_consumer(self, policy):
+        async def scenario():
+            manager = ConnectionManager(max_queue=2, policy=policy, snapshot=lambda: 'snapshot')
+            slow, fast = BlockedSocket(), BlockedSocket()
+            fast.release.set()
+            await manager.connect(slow)
+            await manager.connect(fast)
+            for i in range(5):
+                await manager.broadcast({'n': i})
+            await asyncio.sleep(0.01)
+            queued = list(manager.active_connections[slow].queue._queue) if slow in manager.active_connections else None
+            for conn in list(manager.active_connections.values()):
+                conn.writer.cancel()
+            return manager, slow, fast, queued
+
+        return asyncio.run(scenario())
+
+    def test_fast_client_not_held_back_by_slow_one(self):
+        manager, slow, fast, _ = self.run_slow_consumer('drop')
+
+        self.assertEqual([json.loads(text)['n'] for text in fast.sent], [0, 1, 2, 3, 4])
+        # The slow writer holds one frame, its queue holds two, the rest are dropped
+        self.assertEqual(manager.stats['dropped'], 2)
+
+    def test_coalesce_replaces_backlog_with_snapshot(self):
+        manager, _, _, queued = self.run_slow_consumer('coalesce')
+
+        self.assertIs(queued[0], main.RESYNC)
+        self.assertGreaterEqual(manager.stats['resynced'], 1)
+
+    def test_disconnect_slow_consumer(self):
+        manager, slow, fast, queued = self.run_slow_consumer('disconnect')
+
+        self.assertIsNone(queued)
+        self.assertEqual(slow.closed_with, 1013)
+        self.assertIn(fast, manager.active_connections)
+
+
+    def test_coalescer_batches_and_cancels_pairs(self):
+        async def scenario():
+            frames = []
+
+            async def send(message):
+                frames.append(message)
+
+            coalescer = main.Coalescer(send, window_ms=20)
+            await coalescer.publish({'type': 'added', 'book': {'id': 5}})
+            await coalescer.publish({'type': 'added', 'book': {'id': 6}})
+            await coalescer.publish({'type': 'deleted', 'id': 5})
+            await coalescer.publish({'type': 'deleted', 'id': 1})
+            self.assertEqual(frames, [])
+            await asyncio.sleep(0.05)
+            await coalescer.publish({'type': 'deleted', 'id': 6})
+            await coalescer.flush()
+            return frames, coalescer.stats
+
+        frames, stats = asyncio.run(scenario())
+
+        self.assertEqual(frames, [
+            {'type': 'batch', 'events': [{'type': 'added', 'book': {'id': 6}}, {'type': 'deleted', 'id': 1}]},
+            # A later window holds one event: sent as a plain frame
+            {'type': 'deleted', 'id': 6},
+        ])
+        self.assertEqual(stats, {'events': 5, 'frames': 2, 'cancelled': 2})
+
+    @unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+    def test_redis_backplane_shares_books_between_workers(self):
+        seed = [{'id': 1, 'title': 'A', 'author': 'a'}]
+
+        async def scenario():
+            server = fakeredis.FakeServer()
+            workers = []
+            for _ in range(2):
+                store, manager, ws = BookStore(seed), ConnectionManager(), RecordingSocket()
+                backplane = RedisBackplane(store, client=fakeredis.FakeAsyncRedis(server=server))
+                await backplane.start(manager.broadcast)
+                await manager.connect(ws)
+                workers.append((store, backplane, manager, ws))
+
+            (store_a, backplane_a, _, ws_a), (store_b, backplane_b, _, ws_b) = workers
+            await backplane_a.add_book('Dune', 'Frank Herbert')
+            await backplane_b.add_book('Emma', 'Jane Austen')
+            await backplane_b.delete_book(1)
+            for _ in range(100):
+                if len(ws_a.sent) == 3 and len(ws_b.sent) == 3:
+                    break
+                await asyncio.sleep(0.01)
+
+            for _, backplane, manager, _ in workers:
+                await backplane.stop()
+                for conn in manager.active_connections.values():
+                    conn.writer.cancel()
+            return store_a, store_b, ws_a, ws_b
+
+        store_a, store_b, ws_a, ws_b = asyncio.run(scenario())
+
+        self.assertEqual(ws_a.sent, ws_b.sent)
+        self.assertEqual([event['type'] for event in ws_a.sent], ['added', 'added', 'deleted'])
+        # Ids come from one shared counter, so workers never hand out the same one
+        self.assertEqual([book['id'] for book in store_a.all()], [2, 3])
+        self.assertEqual(store_a.snapshot_text(), store_b.snapshot_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
-from flask import Flask, jsonify, request
+from flask import Flask, current_app, jsonify, request
 from flask_restx import Api, Resource, fields
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import column, event, literal_column, table
 import os
+import re
 from datetime import datetime
 
 basedir = os.path.dirname(os.path.realpath(__file__))
@@ -10,9 +12,11 @@ basedir = os.path.dirname(os.path.realpath(__file__))
 app = Flask(__name__)
 CORS(app)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'books.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'books.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = True
+# auto: FTS5 when the backend supports it, like: always ILIKE
+app.config['BOOK_SEARCH_BACKEND'] = 'auto'
 
 api = Api(app, doc='/', title="Library Management API", description="DEMO")
 
@@ -27,6 +31,96 @@ class Book(db.Model):
     def __repr__(self):
         return self.title
 
+# --- Book search (FTS5) -------------------------------------------------------
+# Week4/app.py, Week 8/app.py and Week 7 library_api/database.py are separate
+# apps with no shared package, so each carries this block. The copies are kept
+# identical on purpose (Week 8/test_app.py checks it): change all three together.
+
+# Full-text index over title/author, kept in sync by triggers on the book table.
+# External content: the FTS table only stores the index, rows live in book.
+BOOK_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, author, content='book', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+
+book_fts = table('book_fts', column('rowid'), column('rank'))
+
+# engine -> whether book_fts exists, so searches don't re-check sqlite_master
+_fts_ready = {}
+
+
+def sqlite_supports_fts5(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+    return 'ENABLE_FTS5' in options
+
+
+@event.listens_for(Book.__table__, 'after_create')
+def create_book_fts(target, connection, **kw):
+    ''' Create and backfill the FTS index whenever the book table is created '''
+    ready = sqlite_supports_fts5(connection)
+    if ready:
+        for statement in BOOK_FTS_DDL:
+            connection.exec_driver_sql(statement)
+    _fts_ready[connection.engine] = ready
+
+
+@event.listens_for(Book.__table__, 'before_drop')
+def drop_book_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS book_fts')
+    _fts_ready[connection.engine] = False
+
+
+def fts_enabled():
+    if current_app.config.get('BOOK_SEARCH_BACKEND', 'auto') == 'like':
+        return False
+    engine = db.engine
+    if engine not in _fts_ready:
+        with engine.connect() as connection:
+            _fts_ready[engine] = connection.dialect.name == 'sqlite' and connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'"
+            ).first() is not None
+    return _fts_ready[engine]
+
+
+def fts_match_expression(search_query):
+    ''' Turn free text into an FTS5 query: every word must match as a token prefix '''
+    return ' '.join(f'"{token}"*' for token in re.findall(r'\w+', search_query))
+
+
+def filter_by_search(query, search_query):
+    '''
+    Restrict a Book query to rows matching search_query.
+    Returns the query and whether it was joined to book_fts (so callers can order by rank).
+    '''
+    match = fts_match_expression(search_query)
+    if match and fts_enabled():
+        query = query.join(book_fts, book_fts.c.rowid == Book.id).filter(
+            literal_column('book_fts').op('MATCH')(match)
+        )
+        return query, True
+
+    search_pattern = f'%{search_query}%'
+    query = query.filter(
+        db.or_(
+            Book.title.ilike(search_pattern),
+            Book.author.ilike(search_pattern)
+        )
+    )
+    return query, False
+
+# --- end book search ----------------------------------------------------------
+
 book_model = api.model(
     'Book',
     {
@@ -86,7 +180,7 @@ class BookResource(Resource):
 class BookSearch(Resource):
     @api.doc(params={
         'q': {
-            'description': 'Title or author',
+            'description': 'Title or author words (prefix match, ranked when full-text search is available)',
             'in': 'query',
             'type': 'string',
             'default': ''
@@ -114,13 +208,9 @@ class BookSearch(Resource):
 
         query = Book.query
         if search_query:
-            search_pattern = f'%{search_query}%'
-            query = query.filter(
-                db.or_(
-                    Book.title.ilike(search_pattern),
-                    Book.author.ilike(search_pattern)
-                )
-            )
+            query, ranked = filter_by_search(query, search_query)
+            if ranked:
+                query = query.order_by(book_fts.c.rank, Book.id)
 
         paginated_books = query.paginate(page=page, per_page=per_page, error_out=False)
         return {
@@ -130,6 +220,13 @@ class BookSearch(Resource):
             'current_page': paginated_books.page
         }
 
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    ''' Create the FTS index on an existing database and backfill it '''
+    with db.engine.begin() as connection:
+        create_book_fts(Book.__table__, connection)
+    print('Full-text search enabled' if fts_enabled() else 'FTS5 not supported, using ILIKE search')
+
 @app.shell_context_processor
 def make_shell_context():
     return {
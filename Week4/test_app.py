@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+# Point the app at a scratch database before it is imported
+db_fd, db_path = tempfile.mkstemp(suffix='.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+from app import app, db, Book, book_fts, filter_by_search
+
+
+class BookSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['BOOK_SEARCH_BACKEND'] = 'auto'
+        with app.app_context():
+            db.engine.echo = False
+            db.create_all()
+            db.session.add_all([
+                Book(title="1984", author="George Orwell"),
+                Book(title="Animal Farm", author="George Orwell"),
+                Book(title="The Hobbit", author="J.R.R. Tolkien"),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.engine.dispose()
+        os.close(db_fd)
+        os.unlink(db_path)
+
+    def search(self, q):
+        with app.app_context():
+            query, ranked = filter_by_search(Book.query, q)
+            if ranked:
+                query = query.order_by(book_fts.c.rank, Book.id)
+            return [book.title for book in query.all()], ranked
+
+    def test_search_uses_fts_index(self):
+        titles, ranked = self.search('orwell')
+
+        self.assertTrue(ranked)
+        self.assertEqual(sorted(titles), ['1984', 'Animal Farm'])
+
+    def test_search_prefix_match(self):
+        self.assertEqual(self.search('hob')[0], ['The Hobbit'])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        with app.app_context():
+            hobbit = Book.query.filter_by(title='The Hobbit').one()
+            hobbit.title = 'The Silmarillion'
+            db.session.delete(Book.query.filter_by(title='1984').one())
+            db.session.commit()
+
+        self.assertEqual(self.search('hobbit')[0], [])
+        self.assertEqual(self.search('silmarillion')[0], ['The Silmarillion'])
+        self.assertEqual(self.search('orwell')[0], ['Animal Farm'])
+
+    def test_search_like_fallback(self):
+        app.config['BOOK_SEARCH_BACKEND'] = 'like'
+        titles, ranked = self.search('rwel')
+
+        self.assertFalse(ranked)
+        self.assertEqual(sorted(titles), ['1984', 'Animal Farm'])
+
+    def test_search_endpoint(self):
+        response = app.test_client().get('/books/search?q=tolkien')
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()